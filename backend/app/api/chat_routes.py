@@ -2,41 +2,44 @@
 Chat API routes for the Tool Assistant
 """
 
-import json
+import asyncio
+import logging
+import os
+
+import orjson
 from typing import List, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import Response
+from sse_starlette.sse import EventSourceResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database.connection import get_db
 from app.services.chat_service import chat_service
+from app.api.schemas import ChatRequest
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Cap concurrent chat streams so a burst of clients can't pile up
+# unbounded in-flight generations; waiters queue on the semaphore instead
+_stream_semaphore = asyncio.Semaphore(int(os.getenv("MAX_CHAT_STREAMS", "16")))
+
 @router.post("/chat")
 async def chat_endpoint(
-    request: Request,
-    db: Session = Depends(get_db)
+    body: ChatRequest,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Chat endpoint for non-streaming responses
     """
     try:
-        data = await request.json()
-        messages = data.get('messages', [])
-        
-        if not messages:
+        if not body.messages:
             raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # Get the last user message
-        user_message = None
-        for message in reversed(messages):
-            if message.get('role') == 'user':
-                user_message = message.get('content', '')
-                break
-        
+
+        user_message = body.last_user_message()
         if not user_message:
             raise HTTPException(status_code=400, detail="No user message found")
-        
+
         # Generate response
         response = await chat_service.generate_response(user_message, db)
         
@@ -47,105 +50,109 @@ async def chat_endpoint(
         }
         
     except Exception as e:
-        print(f"Chat endpoint error: {e}")
+        logger.exception("Chat endpoint error")
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
 @router.post("/chat/stream")
 async def chat_stream_endpoint(
+    body: ChatRequest,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Streaming chat endpoint using Server-Sent Events
     """
     try:
-        data = await request.json()
-        messages = data.get('messages', [])
-        
-        if not messages:
+        if not body.messages:
             raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # Get the last user message
-        user_message = None
-        for message in reversed(messages):
-            if message.get('role') == 'user':
-                user_message = message.get('content', '')
-                break
-        
+
+        user_message = body.last_user_message()
         if not user_message:
             raise HTTPException(status_code=400, detail="No user message found")
-        
+
         async def generate_stream():
             try:
-                async for chunk in chat_service.generate_streaming_response(user_message, db):
-                    # Format as Server-Sent Events
-                    yield f"data: {json.dumps({'content': chunk, 'done': False})}\n\n"
-                
-                # Send completion signal
-                yield f"data: {json.dumps({'content': '', 'done': True})}\n\n"
-                
-            except Exception as e:
-                print(f"Streaming error: {e}")
-                yield f"data: {json.dumps({'content': 'I encountered an error. Please try again.', 'done': True, 'error': True})}\n\n"
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
-            }
-        )
+                # The semaphore is taken inside the generator because the
+                # response body is produced after this handler returns
+                async with _stream_semaphore:
+                    async for chunk in chat_service.generate_streaming_response(user_message, db):
+                        # Stop generating for clients that have gone away
+                        if await request.is_disconnected():
+                            return
+                        yield orjson.dumps({'content': chunk, 'done': False}).decode()
+
+                    # Send completion signal
+                    yield orjson.dumps({'content': '', 'done': True}).decode()
+
+            except Exception:
+                logger.exception("Streaming error")
+                yield orjson.dumps({'content': 'I encountered an error. Please try again.', 'done': True, 'error': True}).decode()
+
+        # EventSourceResponse handles SSE framing and headers, and sends
+        # periodic pings so reverse proxies don't time out slow generations
+        return EventSourceResponse(generate_stream(), ping=15)
         
     except Exception as e:
-        print(f"Chat stream endpoint error: {e}")
+        logger.exception("Chat stream endpoint error")
         raise HTTPException(status_code=500, detail=f"Chat stream error: {str(e)}")
 
+# Static responses serialized once at import time
+_TOOL_CATEGORIES_JSON = orjson.dumps({
+    "categories": [
+        "Hand Tools",
+        "Power Tools",
+        "Measuring Tools",
+        "Safety Equipment",
+        "Fasteners",
+        "Electrical Tools",
+        "Plumbing Tools",
+        "Woodworking Tools",
+        "Metalworking Tools",
+        "Garden Tools"
+    ]
+})
+
+_TASK_REQUIREMENTS_JSON = orjson.dumps({
+    "common_tasks": [
+        "Hanging a picture",
+        "Installing a shelf",
+        "Fixing a leaky faucet",
+        "Installing a light fixture",
+        "Building a deck",
+        "Installing drywall",
+        "Painting a room",
+        "Installing flooring",
+        "Electrical work",
+        "Plumbing repairs"
+    ]
+})
+
 @router.get("/chat/tool-categories")
 async def get_tool_categories():
     """
     Get available tool categories
     """
-    return {
-        "categories": [
-            "Hand Tools",
-            "Power Tools", 
-            "Measuring Tools",
-            "Safety Equipment",
-            "Fasteners",
-            "Electrical Tools",
-            "Plumbing Tools",
-            "Woodworking Tools",
-            "Metalworking Tools",
-            "Garden Tools"
-        ]
-    }
+    return Response(
+        content=_TOOL_CATEGORIES_JSON,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 @router.get("/chat/task-requirements")
 async def get_task_requirements():
     """
     Get common task requirements
     """
-    return {
-        "common_tasks": [
-            "Hanging a picture",
-            "Installing a shelf",
-            "Fixing a leaky faucet",
-            "Installing a light fixture",
-            "Building a deck",
-            "Installing drywall",
-            "Painting a room",
-            "Installing flooring",
-            "Electrical work",
-            "Plumbing repairs"
-        ]
-    }
+    return Response(
+        content=_TASK_REQUIREMENTS_JSON,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 @router.post("/chat/plan-task")
 async def plan_task_endpoint(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Plan a specific task with tool requirements
@@ -163,12 +170,12 @@ async def plan_task_endpoint(
         return plan
         
     except Exception as e:
-        print(f"Task planning error: {e}")
+        logger.exception("Task planning error")
         raise HTTPException(status_code=500, detail=f"Task planning error: {str(e)}")
 
 @router.get("/chat/inventory")
 async def get_inventory_endpoint(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get user's tool inventory
@@ -178,5 +185,5 @@ async def get_inventory_endpoint(
         return inventory
         
     except Exception as e:
-        print(f"Inventory error: {e}")
+        logger.exception("Inventory error")
         raise HTTPException(status_code=500, detail=f"Inventory error: {str(e)}")
@@ -2,301 +2,427 @@
 FastAPI routes for the Tool Detection API
 """
 
+import hashlib
+import io
+import logging
 import os
+import time
 import uuid
-import json
 import asyncio
-from typing import Optional
+import concurrent.futures
+import orjson
+from typing import NamedTuple, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sse_starlette.sse import EventSourceResponse
+from sqlalchemy import insert, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from PIL import Image as PILImage
+from pydantic import TypeAdapter, ValidationError
+from cachetools import TTLCache
 
-from app.database.connection import get_db
+from app.database.connection import engine, get_db, SessionLocal
 from app.database.models import Image
-from app.database.queries import search_images, get_image_by_id, get_recent_images
+from app.database.queries import search_images, get_image_serving_row, get_recent_images
 from app.services.unified_inference import get_unified_detector
 from app.services.onedrive_service import onedrive_service
+from app.services.chat_service import invalidate_inventory_cache
+from app.services.image_loader import ImageLoader
 from app.api.schemas import (
-    UploadResponse, SearchRequest, SearchResultsResponse, 
-    SearchResponse, ErrorResponse, HealthResponse
+    UploadResponse, SearchRequest, SearchResultsResponse,
+    SearchResponse, ErrorResponse, HealthResponse, ChatRequest
 )
 # from app.api.chat_routes import router as chat_router
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Converts a whole list of ORM rows to SearchResponse models in one
+# Rust-side pass instead of per-object Python attribute reads
+_SEARCH_RESULTS_ADAPTER = TypeAdapter(list[SearchResponse])
+
+# Parses the tags form field (a JSON array string) with pydantic-core's
+# rust JSON parser, validating the element types in the same pass
+_TAGS_ADAPTER = TypeAdapter(list[str])
+
+# Resolved once at import - the detector is a process-wide singleton, so
+# re-resolving it inside every handler is wasted work on the hot path
+unified_detector = get_unified_detector()
+
 # Configuration
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
-ALLOWED_EXTENSIONS = os.getenv("ALLOWED_EXTENSIONS", "jpg,jpeg,png").split(",")
+ALLOWED_EXTENSIONS = frozenset(os.getenv("ALLOWED_EXTENSIONS", "jpg,jpeg,png").split(","))
+_ALLOWED_EXTENSIONS_MSG = f"File type not allowed. Allowed types: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+# Uploads are staged here and served immediately; the OneDrive push runs
+# as a background task after the response. Created once at import.
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# When set (e.g. "/internal-uploads"), locally stored images are served by
+# Nginx via X-Accel-Redirect instead of through the Python process. The
+# matching Nginx config is:
+#   location /internal-uploads/ { internal; alias <UPLOAD_DIR>/; }
+X_ACCEL_REDIRECT_PREFIX = os.getenv("X_ACCEL_REDIRECT_PREFIX", "")
+
+
+# Magic-byte signatures for the accepted upload types. Checking the first
+# few bytes rejects a mislabelled file at O(32 bytes) instead of after the
+# full body has been read and handed to PIL.
+_IMAGE_MAGIC_PREFIXES = (
+    b"\xff\xd8\xff",       # JPEG
+    b"\x89PNG\r\n\x1a\n",  # PNG
+)
+
+
+async def _sniff_image_magic(image: UploadFile):
+    """Reject uploads whose leading bytes aren't a known image signature"""
+    head = await image.read(32)
+    await image.seek(0)
+    if not head.startswith(_IMAGE_MAGIC_PREFIXES):
+        raise HTTPException(status_code=400, detail="File content is not a supported image")
+
+
+async def _read_upload(image: UploadFile) -> bytes:
+    """
+    Read the upload body in 1MB chunks, enforcing MAX_FILE_SIZE as it goes.
+
+    An oversized body is rejected as soon as the running total crosses the
+    limit instead of after the whole thing has been buffered. The result is
+    still a single bytes object because the OneDrive upload and the
+    detector both want the full content.
+    """
+    chunks = []
+    size = 0
+    while chunk := await image.read(1 << 20):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=400, detail="File too large")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class ValidatedUpload(NamedTuple):
+    """A validated upload body plus the request metadata the routes reuse"""
+    contents: bytes
+    extension: str
+    original_filename: str
+    content_type: Optional[str]
+
+
+async def validated_upload(image: UploadFile = File(...)) -> ValidatedUpload:
+    """
+    Shared dependency running the upload validation pipeline once.
+
+    The filename and extension checks, the magic-byte sniff and the
+    size-capped chunked read are identical across the upload routes, so
+    they live here instead of being repeated in each handler.
+    """
+    if not image.filename:
+        raise HTTPException(status_code=400, detail="No file provided")
+
+    extension = os.path.splitext(image.filename)[1][1:].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=_ALLOWED_EXTENSIONS_MSG)
+
+    # Sniff the leading bytes so a renamed non-image is rejected before
+    # the whole body is read into memory
+    await _sniff_image_magic(image)
+
+    # Size is enforced during the chunked read
+    contents = await _read_upload(image)
+    return ValidatedUpload(contents, extension, image.filename, image.content_type)
+
+
+def _verify_image_bytes(contents: bytes):
+    """Validate that bytes decode as an image (CPU-bound, runs in the process pool)"""
+    with PILImage.open(io.BytesIO(contents)) as img:
+        img.verify()
+
+
+# PIL decoding is CPU-bound and holds the GIL for much of its work, so a
+# thread is not enough to keep the event loop responsive - validation runs
+# in a process pool, created lazily so workers fork only when needed
+_process_pool = None
+
+
+def _get_process_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _process_pool
+
+
+async def _verify_image(contents: bytes):
+    """Validate image bytes without blocking the event loop"""
+    global _process_pool
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_get_process_pool(), _verify_image_bytes, contents)
+    except concurrent.futures.process.BrokenProcessPool:
+        # A killed worker poisons the whole pool; drop it so the next call
+        # forks a fresh one, and validate this request in a thread instead
+        # of failing the upload
+        _process_pool = None
+        await asyncio.to_thread(_verify_image_bytes, contents)
+
+
+def get_image_loader(db: AsyncSession = Depends(get_db)) -> ImageLoader:
+    """Dependency providing a request-scoped batching image loader"""
+    return ImageLoader(db)
+
+
+def _stage_upload_locally(contents: bytes, filename: str):
+    """Write the upload into UPLOAD_DIR so it is servable right away"""
+    with open(os.path.join(UPLOAD_DIR, filename), "wb") as f:
+        f.write(contents)
+
+
+async def _upload_to_onedrive_and_update(image_id, contents: bytes, filename: str):
+    """
+    Background task: push a staged upload to OneDrive, then record the
+    resulting file ids on the image row.
+
+    Runs after the response has been sent, so the client never waits on
+    the cloud round-trip. Until it completes the image is served from the
+    local staging copy.
+    """
+    onedrive_result = await asyncio.to_thread(onedrive_service.upload_file, contents, filename)
+    if not onedrive_result.get("success"):
+        logger.error(f"Background OneDrive upload failed for {filename}: {onedrive_result.get('error')}")
+        return
+
+    async with SessionLocal() as db:
+        await db.execute(
+            update(Image)
+            .where(Image.id == image_id)
+            .values(
+                onedrive_file_id=onedrive_result.get("file_id"),
+                onedrive_file_url=onedrive_result.get("file_url"),
+                onedrive_download_url=onedrive_result.get("download_url"),
+            )
+        )
+        await db.commit()
+    logger.info(f"Background OneDrive upload finished for {filename}")
+
+
+# Cap concurrent chat streams so a burst of clients can't pile up
+# unbounded in-flight generations; waiters queue on the semaphore instead
+_stream_semaphore = asyncio.Semaphore(int(os.getenv("MAX_CHAT_STREAMS", "16")))
+
+# search-by-image often sees the same photo repeatedly (retries, shared
+# images); remember detected tags by content hash so a repeat skips the
+# Gemini round-trip entirely
+_search_tags_cache: TTLCache = TTLCache(maxsize=256, ttl=600)
+
+# Identical text searches repeat constantly (map pans, autocomplete,
+# refreshes); a hit serves the validated results with zero DB work.
+# Coordinates are rounded to ~11m so trivially-jittered map positions
+# share an entry. Cleared whenever a new image lands.
+_search_results_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+
+def _search_cache_key(query, lat, lon, radius_m, limit):
+    return (
+        query,
+        round(lat, 4) if lat is not None else None,
+        round(lon, 4) if lon is not None else None,
+        radius_m,
+        limit,
+    )
+
+
+def _sse_payload(content: str, done: bool, error: bool = False) -> str:
+    """Serialize one SSE chunk payload with orjson (much faster than stdlib json)"""
+    payload = {"content": content, "done": done}
+    if error:
+        payload["error"] = True
+    return orjson.dumps(payload).decode()
 
 
 @router.post("/detect-tools", response_model=dict)
 async def detect_tools_only(
-    image: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    upload: ValidatedUpload = Depends(validated_upload),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Detect tools in an image using AI without saving to database
     """
     try:
-        # Validate file
-        if not image.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
-        
-        # Check file extension
-        file_extension = image.filename.split('.')[-1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Read and validate image
-        contents = await image.read()
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
-        
-        # Create temporary file for AI processing
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
-        try:
-            # Run AI inference using Google Cloud AI
-            unified_detector = get_unified_detector()
-            tags, confidences, metadata = unified_detector.detect_tools(temp_file_path)
-            
-            # Return only the detection results, no database save
-            return {
-                "tags": tags,
-                "confidences": confidences,
-                "metadata": metadata
-            }
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-        
+        contents = upload.contents
+
+        # Run AI inference straight from the in-memory bytes - no temp
+        # file. The detector is async, so the Gemini round-trip awaits on
+        # the event loop without tying up a worker thread
+        tags, confidences, metadata = await unified_detector.detect_tools_from_bytes(contents)
+
+        # Return only the detection results, no database save
+        return {
+            "tags": tags,
+            "confidences": confidences,
+            "metadata": metadata
+        }
+
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error in tool detection: {e}")
+    except Exception:
+        logger.exception("Error in tool detection")
         raise HTTPException(status_code=500, detail="Tool detection failed")
 
 
 @router.post("/save-image", response_model=UploadResponse)
 async def save_image_with_tags(
-    image: UploadFile = File(...),
+    background_tasks: BackgroundTasks,
+    upload: ValidatedUpload = Depends(validated_upload),
     latitude: float = Form(...),
     longitude: float = Form(...),
     tags: str = Form(...),  # JSON string of tags
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Save an image to database with user-confirmed tags
     """
     try:
-        import json
-        
-        # Parse tags from JSON string
+        # Parse and validate the tags JSON string in one pydantic-core pass.
+        # The wire format stays a single form field so the frontend is
+        # untouched.
         try:
-            tags_list = json.loads(tags)
-        except json.JSONDecodeError:
+            tags_list = _TAGS_ADAPTER.validate_json(tags)
+        except ValidationError:
             raise HTTPException(status_code=400, detail="Invalid tags format")
-        
-        # Validate file
-        if not image.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
-        
-        # Check file extension
-        file_extension = image.filename.split('.')[-1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Read and validate image
-        contents = await image.read()
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
-        
+
+        contents = upload.contents
+
         # Generate unique filename
         file_id = str(uuid.uuid4())
-        filename = f"{file_id}.{file_extension}"
-        
-        # Validate image can be opened (using temporary file)
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
+        filename = f"{file_id}.{upload.extension}"
+
+        # Validate image directly from the in-memory bytes
         try:
-            # Validate image
-            with PILImage.open(temp_file_path) as img:
-                img.verify()
+            await _verify_image(contents)
         except Exception:
-            os.unlink(temp_file_path)
             raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Upload directly to OneDrive (no local storage)
-        onedrive_result = onedrive_service.upload_file(contents, filename)
-        
-        if onedrive_result.get("success"):
-            print(f"OneDrive upload successful: {onedrive_result.get('file_url')}")
-            # Create database record with OneDrive info only
-            db_image = Image(
-                filename=filename,
-                original_filename=image.filename,
-                tags=tags_list,
-                confidences=[],  # No confidence scores for user-edited tags
-                latitude=latitude,
-                longitude=longitude,
-                location=f'POINT({longitude} {latitude})',
-                file_size=len(contents),
-                mime_type=image.content_type,
-                onedrive_file_id=onedrive_result.get("file_id"),
-                onedrive_file_url=onedrive_result.get("file_url"),
-                onedrive_download_url=onedrive_result.get("download_url")
-            )
-        else:
-            print(f"OneDrive upload failed: {onedrive_result.get('error')}")
-            raise HTTPException(status_code=500, detail="Failed to upload to cloud storage. Please try again.")
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
-        
-        db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
-        
+
+        # Stage locally so the image is servable at once; the OneDrive push
+        # runs as a background task after the response
+        await asyncio.to_thread(_stage_upload_locally, contents, filename)
+
+        # Insert with RETURNING so the generated id/created_at come back on
+        # the same round-trip instead of a commit + refresh SELECT. The
+        # onedrive_* columns stay NULL until the background upload lands.
+        image_values = dict(
+            filename=filename,
+            original_filename=upload.original_filename,
+            # Lowercase-normalized so array-overlap tag lookups match
+            tags=[t.lower() for t in tags_list],
+            confidences=[],  # No confidence scores for user-edited tags
+            latitude=latitude,
+            longitude=longitude,
+            # location is a generated column - the database derives the
+            # point from the lat/lon binds
+            file_size=len(contents),
+            mime_type=upload.content_type
+        )
+        inserted = (await db.execute(
+            insert(Image).values(**image_values).returning(Image.id, Image.created_at)
+        )).one()
+        await db.commit()
+
+        # Cached search results and chat inventory are stale as soon as a
+        # new image lands
+        _search_results_cache.clear()
+        invalidate_inventory_cache()
+
+        # Push to OneDrive after the response has gone out
+        background_tasks.add_task(_upload_to_onedrive_and_update, inserted.id, contents, filename)
+
         response = UploadResponse(
-            id=str(db_image.id),
-            filename=db_image.filename,
-            original_filename=db_image.original_filename,
-            tags=db_image.tags,
-            confidences=db_image.confidences,
-            latitude=db_image.latitude,
-            longitude=db_image.longitude,
-            created_at=db_image.created_at,
-            file_size=db_image.file_size,
-            mime_type=db_image.mime_type,
-            onedrive_file_id=db_image.onedrive_file_id,
-            onedrive_file_url=db_image.onedrive_file_url,
-            onedrive_download_url=db_image.onedrive_download_url
+            id=str(inserted.id),
+            created_at=inserted.created_at,
+            **image_values
         )
-        
-        print(f"Image saved successfully - ID: {response.id}, Tags: {response.tags}, OneDrive URL: {response.onedrive_file_url}")
+
+        logger.info(f"Image saved successfully - ID: {response.id}, Tags: {response.tags}")
         return response
-        
+
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error saving image: {e}")
+    except Exception:
+        logger.exception("Error saving image")
         raise HTTPException(status_code=500, detail="Failed to save image")
 
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_image(
-    image: UploadFile = File(...),
+    background_tasks: BackgroundTasks,
+    upload: ValidatedUpload = Depends(validated_upload),
     latitude: float = Form(...),
     longitude: float = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Upload an image and detect tools using AI
     """
     try:
-        # Validate file
-        if not image.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
-        
-        # Check file extension
-        file_extension = image.filename.split('.')[-1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Read and validate image
-        contents = await image.read()
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
-        
+        contents = upload.contents
+
         # Generate unique filename
         file_id = str(uuid.uuid4())
-        filename = f"{file_id}.{file_extension}"
-        
-        # Validate image can be opened (using temporary file)
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
+        filename = f"{file_id}.{upload.extension}"
+
+        # Validate image directly from the in-memory bytes before touching disk
         try:
-            # Validate image
-            with PILImage.open(temp_file_path) as img:
-                img.verify()
+            await _verify_image(contents)
         except Exception:
-            os.unlink(temp_file_path)
             raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Run AI inference using Google Cloud AI
-        unified_detector = get_unified_detector()
-        tags, confidences, metadata = unified_detector.detect_tools(temp_file_path)
-        
-        # Upload directly to OneDrive (no local storage)
-        onedrive_result = onedrive_service.upload_file(contents, filename)
-        
-        if onedrive_result.get("success"):
-            print(f"OneDrive upload successful: {onedrive_result.get('file_url')}")
-            # Create database record with OneDrive info only
-            db_image = Image(
-                filename=filename,
-                original_filename=image.filename,
-                tags=tags,
-                confidences=confidences,
-                latitude=latitude,
-                longitude=longitude,
-                location=f'POINT({longitude} {latitude})',
-                file_size=len(contents),
-                mime_type=image.content_type,
-                onedrive_file_id=onedrive_result.get("file_id"),
-                onedrive_file_url=onedrive_result.get("file_url"),
-                onedrive_download_url=onedrive_result.get("download_url")
-            )
-        else:
-            print(f"OneDrive upload failed: {onedrive_result.get('error')}")
-            raise HTTPException(status_code=500, detail="Failed to upload to cloud storage. Please try again.")
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
-        
-        db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
-        
+
+        # Gemini detection (async) and the local staging write (a worker
+        # thread) are independent - run them concurrently. The OneDrive
+        # push is deferred to a background task so the client never waits
+        # on it.
+        (tags, confidences, metadata), _ = await asyncio.gather(
+            unified_detector.detect_tools_from_bytes(contents),
+            asyncio.to_thread(_stage_upload_locally, contents, filename),
+        )
+
+        # Insert with RETURNING so the generated id/created_at come back on
+        # the same round-trip instead of a commit + refresh SELECT. The
+        # onedrive_* columns stay NULL until the background upload lands.
+        image_values = dict(
+            filename=filename,
+            original_filename=upload.original_filename,
+            # Lowercase-normalized so array-overlap tag lookups match
+            tags=[t.lower() for t in tags],
+            confidences=confidences,
+            latitude=latitude,
+            longitude=longitude,
+            # location is a generated column - the database derives the
+            # point from the lat/lon binds
+            file_size=len(contents),
+            mime_type=upload.content_type
+        )
+        inserted = (await db.execute(
+            insert(Image).values(**image_values).returning(Image.id, Image.created_at)
+        )).one()
+        await db.commit()
+
+        # Cached search results and chat inventory are stale as soon as a
+        # new image lands
+        _search_results_cache.clear()
+        invalidate_inventory_cache()
+
+        # Push to OneDrive after the response has gone out
+        background_tasks.add_task(_upload_to_onedrive_and_update, inserted.id, contents, filename)
+
         response = UploadResponse(
-            id=str(db_image.id),
-            filename=db_image.filename,
-            original_filename=db_image.original_filename,
-            tags=db_image.tags,
-            confidences=db_image.confidences,
-            latitude=db_image.latitude,
-            longitude=db_image.longitude,
-            created_at=db_image.created_at,
-            file_size=db_image.file_size,
-            mime_type=db_image.mime_type,
-            onedrive_file_id=db_image.onedrive_file_id,
-            onedrive_file_url=db_image.onedrive_file_url,
-            onedrive_download_url=db_image.onedrive_download_url
+            id=str(inserted.id),
+            created_at=inserted.created_at,
+            **image_values
         )
-        
-        print(f"Upload successful - Image ID: {response.id}, Filename: {response.filename}, OneDrive URL: {response.onedrive_file_url}")
+
+        logger.info(f"Upload successful - Image ID: {response.id}, Filename: {response.filename}")
         return response
         
     except HTTPException:
@@ -312,7 +438,7 @@ async def search_images_endpoint(
     lon: Optional[float] = Query(None, description="Longitude for location-based search"),
     radius_m: float = Query(10000, description="Search radius in meters"),
     limit: int = Query(50, description="Maximum number of results"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Search images by tags and/or location
@@ -335,40 +461,25 @@ async def search_images_endpoint(
         if lon is not None and (lon < -180 or lon > 180):
             raise HTTPException(status_code=400, detail="Longitude must be between -180 and 180")
         
-        # Perform search with fallback
-        print(f"Text search query: '{query}'")
-        try:
-            results = search_images(db, query, lat, lon, radius_m, limit)
-            print(f"Text search found {len(results)} results")
-        except Exception as e:
-            print(f"Main search failed: {e}, trying simple search")
-            from app.database.queries import simple_search_images
-            results = simple_search_images(db, query, limit)
-            print(f"Simple search found {len(results)} results")
-        
-        # Convert to response format
-        search_results = []
-        for image in results:
-            search_results.append(SearchResponse(
-                id=str(image.id),
-                filename=image.filename,
-                original_filename=image.original_filename,
-                tags=image.tags,
-                confidences=image.confidences,
-                latitude=image.latitude,
-                longitude=image.longitude,
-                created_at=image.created_at,
-                file_size=image.file_size,
-                mime_type=image.mime_type,
-                onedrive_file_id=image.onedrive_file_id,
-                onedrive_file_url=image.onedrive_file_url,
-                onedrive_download_url=image.onedrive_download_url
-            ))
-        
+        # Perform search with fallback, skipping the DB entirely when the
+        # same search was answered recently
+        cache_key = _search_cache_key(query.lower().strip(), lat, lon, radius_m, limit)
+        search_results = _search_results_cache.get(cache_key)
+        if search_results is None:
+            logger.info(f"Text search query: '{query}'")
+            # The fused query carries its own fuzzy fallback arm, so there
+            # is no second search to fall back to
+            results = await search_images(db, query, lat, lon, radius_m, limit)
+            logger.info(f"Text search found {len(results)} results")
+
+            # Convert to response format in one bulk validation pass
+            search_results = _SEARCH_RESULTS_ADAPTER.validate_python(results)
+            _search_results_cache[cache_key] = search_results
+
         location_info = None
         if lat is not None and lon is not None:
             location_info = {"lat": lat, "lon": lon}
-        
+
         return SearchResultsResponse(
             results=search_results,
             total=len(search_results),
@@ -383,63 +494,133 @@ async def search_images_endpoint(
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 
+# Uploaded images are keyed by UUID and never modified, so they can be
+# cached aggressively by browsers and CDNs
+_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Short-lived cache of serving rows: bursts of image requests (a search
+# results grid) re-resolve the same ids without a DB round-trip each time
+_image_row_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+
+
 @router.get("/images/{image_id}")
-async def get_image_file(image_id: str, db: Session = Depends(get_db)):
+async def get_image_file(
+    image_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
     """
     Serve an image file by ID - always fetch fresh URLs to avoid token expiration
     """
     try:
-        print(f"Serving image request for ID: {image_id}")
-        
-        # Get image record from database
-        db_image = get_image_by_id(db, image_id)
+        logger.info(f"Serving image request for ID: {image_id}")
+
+        # Image content is immutable per ID, so a matching ETag means the
+        # client copy is still valid - skip the DB and OneDrive entirely
+        etag = f'"{image_id}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304)
+
+        # Get the lean serving row via the cache - only the columns this
+        # handler touches, so the tag/confidence arrays and geography stay
+        # in the database
+        db_image = _image_row_cache.get(image_id)
+        if db_image is None:
+            db_image = await get_image_serving_row(db, image_id)
+            if db_image is not None:
+                _image_row_cache[image_id] = db_image
         if not db_image:
-            print(f"Image not found in database: {image_id}")
+            logger.warning(f"Image not found in database: {image_id}")
             raise HTTPException(status_code=404, detail="Image not found")
         
+        # Prefer the staged local copy when it exists - a fresh upload may
+        # not have finished its background OneDrive push yet, and the local
+        # file avoids the cloud round-trip entirely. EAFP with a single
+        # stat rather than an exists() probe per request.
+        local_path = os.path.join(UPLOAD_DIR, db_image.filename)
+        try:
+            os.stat(local_path)
+            local_exists = True
+        except FileNotFoundError:
+            local_exists = False
+
+        if local_exists:
+            # With Nginx in front, hand serving off via X-Accel-Redirect -
+            # the bytes then move kernel-side through sendfile without
+            # traversing this process
+            if X_ACCEL_REDIRECT_PREFIX:
+                return Response(
+                    headers={
+                        "X-Accel-Redirect": f"{X_ACCEL_REDIRECT_PREFIX}/{db_image.filename}",
+                        "Content-Type": db_image.mime_type or "image/jpeg",
+                        "ETag": etag,
+                        "Cache-Control": _IMAGE_CACHE_CONTROL
+                    }
+                )
+            return FileResponse(
+                local_path,
+                media_type=db_image.mime_type or "image/jpeg",
+                headers={"ETag": etag, "Cache-Control": _IMAGE_CACHE_CONTROL}
+            )
+
         # Always fetch fresh URL from OneDrive to avoid token expiration
-        print(f"Fetching fresh OneDrive URL for: {db_image.filename}")
+        logger.info(f"Fetching fresh OneDrive URL for: {db_image.filename}")
         
-        # Get fresh download URL from OneDrive using file ID
+        # Get fresh download URL from OneDrive using file ID (blocking
+        # Graph call, so off-loop)
         if db_image.onedrive_file_id:
             try:
-                fresh_download_url = onedrive_service.get_fresh_download_url(db_image.onedrive_file_id)
+                fresh_download_url = await asyncio.to_thread(
+                    onedrive_service.get_fresh_download_url, db_image.onedrive_file_id
+                )
                 if fresh_download_url:
-                    print(f"Redirecting to fresh OneDrive download URL")
+                    logger.info("Redirecting to fresh OneDrive download URL")
                     from fastapi.responses import RedirectResponse
                     return RedirectResponse(url=fresh_download_url)
-            except Exception as e:
-                print(f"Failed to get fresh download URL: {e}")
+            except Exception:
+                logger.exception("Failed to get fresh download URL")
         
         # Fallback: Try to proxy the content directly
         if db_image.onedrive_file_id:
-            print(f"Proxying OneDrive content using file ID: {db_image.onedrive_file_id}")
+            logger.info(f"Proxying OneDrive content using file ID: {db_image.onedrive_file_id}")
             try:
-                import requests
-                # Get fresh access token
-                if not onedrive_service._refresh_token_if_needed():
+                # Get fresh access token (blocking Graph call, so off-loop)
+                if not await asyncio.to_thread(onedrive_service._refresh_token_if_needed):
                     raise Exception("Unable to refresh access token")
-                
+
                 # Construct the content URL using file ID
                 content_url = f"{onedrive_service.base_url}/sites/{onedrive_service.sharepoint_site_id}/drive/items/{db_image.onedrive_file_id}/content"
-                
+
                 headers = {
                     'Authorization': f'Bearer {onedrive_service.access_token}'
                 }
-                response = requests.get(content_url, headers=headers)
+                # Shared AsyncClient from app.state. Open the upstream
+                # response in streaming mode and pipe it through chunk by
+                # chunk, so the proxy never buffers a whole image
+                client = request.app.state.http_client
+                upstream = client.build_request("GET", content_url, headers=headers)
+                response = await client.send(upstream, stream=True)
                 if response.status_code == 200:
-                    from fastapi.responses import Response
-                    return Response(
-                        content=response.content,
-                        media_type=db_image.mime_type or "image/jpeg"
+                    async def proxy_stream():
+                        try:
+                            async for chunk in response.aiter_bytes(65536):
+                                yield chunk
+                        finally:
+                            await response.aclose()
+
+                    return StreamingResponse(
+                        proxy_stream(),
+                        media_type=db_image.mime_type or "image/jpeg",
+                        headers={"ETag": etag, "Cache-Control": _IMAGE_CACHE_CONTROL}
                     )
                 else:
-                    print(f"Failed to fetch OneDrive content: {response.status_code}")
-            except Exception as e:
-                print(f"Error fetching OneDrive content: {e}")
-        
+                    await response.aclose()
+                    logger.warning(f"Failed to fetch OneDrive content: {response.status_code}")
+            except Exception:
+                logger.exception("Error fetching OneDrive content")
+
         # If no OneDrive file ID available
-        print(f"No OneDrive file ID available for image: {image_id}")
+        logger.warning(f"No OneDrive file ID available for image: {image_id}")
         raise HTTPException(status_code=404, detail="Image not available in cloud storage")
         
     except HTTPException:
@@ -449,12 +630,12 @@ async def get_image_file(image_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/images/{image_id}/info", response_model=SearchResponse)
-async def get_image_info(image_id: str, db: Session = Depends(get_db)):
+async def get_image_info(image_id: str, loader: ImageLoader = Depends(get_image_loader)):
     """
     Get image metadata by ID
     """
     try:
-        db_image = get_image_by_id(db, image_id)
+        db_image = await loader.load(image_id)
         if not db_image:
             raise HTTPException(status_code=404, detail="Image not found")
         
@@ -480,21 +661,36 @@ async def get_image_info(image_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to retrieve image info: {str(e)}")
 
 
+# Load balancers probe /health every few seconds per instance; cache the
+# DB ping and the model info briefly so probes don't turn into DB load
+_HEALTH_PING_TTL = 5.0
+_MODELS_INFO_TTL = 30.0
+_health_ping_cache = {"ts": 0.0, "connected": False}
+_models_info_cache = {"ts": 0.0, "value": None}
+
+
 @router.get("/health", response_model=HealthResponse)
-async def health_check(db: Session = Depends(get_db)):
+async def health_check():
     """
     Health check endpoint
     """
-    try:
-        # Check database connection
-        db.execute("SELECT 1")
-        database_connected = True
-    except Exception:
-        database_connected = False
-    
+    now = time.monotonic()
+    if now - _health_ping_cache["ts"] < _HEALTH_PING_TTL:
+        database_connected = _health_ping_cache["connected"]
+    else:
+        try:
+            # Ping straight off the engine - cached probes shouldn't check
+            # out (or wait on) a pooled session at all
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            database_connected = True
+        except Exception:
+            database_connected = False
+        _health_ping_cache["ts"] = now
+        _health_ping_cache["connected"] = database_connected
+
     # Check model loading
     try:
-        unified_detector = get_unified_detector()
         available_models = unified_detector.get_available_models()
         models_loaded = any(available_models.values())
     except Exception:
@@ -514,8 +710,11 @@ async def get_models_info():
     Get information about loaded AI models
     """
     try:
-        unified_detector = get_unified_detector()
-        return unified_detector.get_model_info()
+        now = time.monotonic()
+        if _models_info_cache["value"] is None or now - _models_info_cache["ts"] >= _MODELS_INFO_TTL:
+            _models_info_cache["value"] = unified_detector.get_model_info()
+            _models_info_cache["ts"] = now
+        return _models_info_cache["value"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get model info: {str(e)}")
 
@@ -526,7 +725,6 @@ async def get_available_models():
     Get information about available AI models
     """
     try:
-        unified_detector = get_unified_detector()
         return unified_detector.get_available_models()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get available models: {str(e)}")
@@ -534,104 +732,66 @@ async def get_available_models():
 
 @router.post("/search-by-image", response_model=SearchResultsResponse)
 async def search_by_image(
-    image: UploadFile = File(...),
+    upload: ValidatedUpload = Depends(validated_upload),
     lat: Optional[float] = Query(None, description="Latitude for location-based search"),
     lon: Optional[float] = Query(None, description="Longitude for location-based search"),
     radius_m: float = Query(10000, description="Search radius in meters"),
     limit: int = Query(50, description="Maximum number of results"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Search for similar tool images using an uploaded image
     """
     try:
-        # Validate file
-        if not image.filename:
-            raise HTTPException(status_code=400, detail="No image provided")
-        
-        # Check file extension
-        file_extension = image.filename.split('.')[-1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Read and validate image
-        contents = await image.read()
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
-        
-        # Create temporary file for processing
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
-        try:
-            # Analyze the uploaded image to get tags
-            unified_detector = get_unified_detector()
-            search_tags, _, _ = unified_detector.detect_tools(temp_file_path)
-            
-            if not search_tags:
-                raise HTTPException(status_code=400, detail="No tools detected in the uploaded image")
-            
-            # Search for images with similar tags using database query
-            from app.database.queries import search_images_by_tags
-            results = search_images_by_tags(db, search_tags, lat, lon, radius_m, limit)
-            
-            # Database already filtered the results, so use them directly
-            print(f"Search tags: {search_tags}")
-            print(f"Database returned {len(results)} matching images")
-            
-            # Debug: Show what was found
-            if results:
-                print("Matching images found:")
-                for i, img in enumerate(results[:5]):  # Show first 5 images
-                    print(f"  Image {i+1}: ID={img.id}, Tags={img.tags}")
-            else:
-                print("No matching images found in database")
-            
-            # Use the database results directly (they're already filtered)
-            similar_images = results[:limit]
-            
-            # Convert to response format
-            search_results = []
-            for image in similar_images:
-                search_results.append(SearchResponse(
-                    id=str(image.id),
-                    filename=image.filename,
-                    original_filename=image.original_filename,
-                    tags=image.tags,
-                    confidences=image.confidences,
-                    latitude=image.latitude,
-                    longitude=image.longitude,
-                    created_at=image.created_at,
-                    file_size=image.file_size,
-                    mime_type=image.mime_type,
-                    onedrive_file_id=image.onedrive_file_id,
-                    onedrive_file_url=image.onedrive_file_url,
-                    onedrive_download_url=image.onedrive_download_url
-                ))
-            
-            location_info = None
-            if lat is not None and lon is not None:
-                location_info = {"lat": lat, "lon": lon}
-            
-            return SearchResultsResponse(
-                results=search_results,
-                total=len(search_results),
-                query=f"Image search with tags: {', '.join(search_tags)}",
-                location=location_info,
-                radius_m=radius_m if lat is not None else None
-            )
-            
-        finally:
-            # Clean up temporary file
-            import os
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-        
+        contents = upload.contents
+
+        # Analyze the uploaded image to get tags straight from the bytes -
+        # no temp file round-trip. blake2b is much cheaper than the
+        # inference it can short-circuit.
+        content_hash = hashlib.blake2b(contents, digest_size=16).hexdigest()
+        search_tags = _search_tags_cache.get(content_hash)
+        if search_tags is None:
+            search_tags, _, _ = await unified_detector.detect_tools_from_bytes(contents)
+            if search_tags:
+                _search_tags_cache[content_hash] = search_tags
+
+        if not search_tags:
+            raise HTTPException(status_code=400, detail="No tools detected in the uploaded image")
+
+        # Search for images with similar tags using database query
+        from app.database.queries import search_images_by_tags
+        results = await search_images_by_tags(db, search_tags, lat, lon, radius_m, limit)
+
+        # Database already filtered the results, so use them directly
+        logger.info(f"Search tags: {search_tags}")
+        logger.info(f"Database returned {len(results)} matching images")
+
+        # Debug: Show what was found
+        if results:
+            logger.debug("Matching images found:")
+            for i, img in enumerate(results[:5]):  # Show first 5 images
+                logger.debug(f"  Image {i+1}: ID={img.id}, Tags={img.tags}")
+        else:
+            logger.info("No matching images found in database")
+
+        # Use the database results directly (they're already filtered)
+        similar_images = results[:limit]
+
+        # Convert to response format
+        search_results = _SEARCH_RESULTS_ADAPTER.validate_python(similar_images)
+
+        location_info = None
+        if lat is not None and lon is not None:
+            location_info = {"lat": lat, "lon": lon}
+
+        return SearchResultsResponse(
+            results=search_results,
+            total=len(search_results),
+            query=f"Image search with tags: {', '.join(search_tags)}",
+            location=location_info,
+            radius_m=radius_m if lat is not None else None
+        )
+
     except HTTPException:
         raise
     except Exception as e:
@@ -647,32 +807,23 @@ async def chat_test():
 # Chat endpoints
 @router.post("/chat")
 async def chat_endpoint(
-    request: Request,
-    db: Session = Depends(get_db)
+    body: ChatRequest,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Chat endpoint for non-streaming responses
     """
     try:
-        data = await request.json()
-        messages = data.get('messages', [])
-        
-        if not messages:
+        if not body.messages:
             raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # Get the last user message
-        user_message = None
-        for message in reversed(messages):
-            if message.get('role') == 'user':
-                user_message = message.get('content', '')
-                break
-        
+
+        user_message = body.last_user_message()
         if not user_message:
             raise HTTPException(status_code=400, detail="No user message found")
-        
+
         # Get real inventory data
         # Get recent images from database
-        recent_images = get_recent_images(db, limit=100)
+        recent_images = await get_recent_images(db, limit=100)
         
         # Process inventory
         tool_counts = {}
@@ -722,87 +873,102 @@ async def chat_endpoint(
         }
         
     except Exception as e:
-        print(f"Chat endpoint error: {e}")
+        logger.exception("Chat endpoint error")
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
 
 @router.post("/chat/stream")
 async def chat_stream_endpoint(
+    body: ChatRequest,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Streaming chat endpoint using Server-Sent Events
     """
     try:
-        data = await request.json()
-        messages = data.get('messages', [])
-        
-        if not messages:
+        if not body.messages:
             raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # Get the last user message
-        user_message = None
-        for message in reversed(messages):
-            if message.get('role') == 'user':
-                user_message = message.get('content', '')
-                break
-        
+
+        user_message = body.last_user_message()
         if not user_message:
             raise HTTPException(status_code=400, detail="No user message found")
-        
+
         async def generate_stream():
             try:
-                # Use the real chat service for streaming
-                from app.services.chat_service import ChatService
-                chat_service = ChatService()
-                
-                # Generate streaming response
-                async for chunk in chat_service.generate_streaming_response(user_message, db):
-                    yield f"data: {json.dumps({'content': chunk, 'done': False})}\n\n"
-                    await asyncio.sleep(0.05)  # Small delay for streaming effect
-                
-                # Send completion signal
-                yield f"data: {json.dumps({'content': '', 'done': True})}\n\n"
-                
-            except Exception as e:
-                print(f"Streaming error: {e}")
-                yield f"data: {json.dumps({'content': 'I encountered an error. Please try again.', 'done': True, 'error': True})}\n\n"
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
-            }
-        )
+                # The semaphore is taken inside the generator because the
+                # response body is produced after this handler returns
+                async with _stream_semaphore:
+                    # Use the shared chat service; chunks are forwarded as
+                    # fast as the generator produces them - no artificial
+                    # pacing delay
+                    from app.services.chat_service import chat_service
+
+                    async for chunk in chat_service.generate_streaming_response(user_message, db):
+                        # Stop generating for clients that have gone away
+                        if await request.is_disconnected():
+                            return
+                        yield _sse_payload(chunk, done=False)
+
+                    # Send completion signal
+                    yield _sse_payload('', done=True)
+
+            except Exception:
+                logger.exception("Streaming error")
+                yield _sse_payload('I encountered an error. Please try again.', done=True, error=True)
+
+        # EventSourceResponse handles SSE framing and headers, and sends
+        # periodic pings so reverse proxies don't time out slow generations
+        return EventSourceResponse(generate_stream(), ping=15)
         
     except Exception as e:
-        print(f"Chat stream endpoint error: {e}")
+        logger.exception("Chat stream endpoint error")
         raise HTTPException(status_code=500, detail=f"Chat stream error: {str(e)}")
 
 
+# Static responses serialized once at import time - the handlers just hand
+# the pre-built bytes to starlette instead of re-running JSON encoding
+_TOOL_CATEGORIES_JSON = orjson.dumps({
+    "categories": [
+        "Hand Tools",
+        "Power Tools",
+        "Measuring Tools",
+        "Safety Equipment",
+        "Fasteners",
+        "Electrical Tools",
+        "Plumbing Tools",
+        "Woodworking Tools",
+        "Metalworking Tools",
+        "Garden Tools"
+    ]
+})
+
+_TASK_REQUIREMENTS_JSON = orjson.dumps({
+    "common_tasks": [
+        "Hanging a picture",
+        "Installing a shelf",
+        "Fixing a leaky faucet",
+        "Installing a light fixture",
+        "Building a deck",
+        "Installing drywall",
+        "Painting a room",
+        "Installing flooring",
+        "Electrical work",
+        "Plumbing repairs"
+    ]
+})
+
+
 @router.get("/chat/tool-categories")
 async def get_tool_categories():
     """
     Get available tool categories
     """
-    return {
-        "categories": [
-            "Hand Tools",
-            "Power Tools", 
-            "Measuring Tools",
-            "Safety Equipment",
-            "Fasteners",
-            "Electrical Tools",
-            "Plumbing Tools",
-            "Woodworking Tools",
-            "Metalworking Tools",
-            "Garden Tools"
-        ]
-    }
+    return Response(
+        content=_TOOL_CATEGORIES_JSON,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 
 @router.get("/chat/task-requirements")
@@ -810,17 +976,8 @@ async def get_task_requirements():
     """
     Get common task requirements
     """
-    return {
-        "common_tasks": [
-            "Hanging a picture",
-            "Installing a shelf",
-            "Fixing a leaky faucet",
-            "Installing a light fixture",
-            "Building a deck",
-            "Installing drywall",
-            "Painting a room",
-            "Installing flooring",
-            "Electrical work",
-            "Plumbing repairs"
-        ]
-    }
+    return Response(
+        content=_TASK_REQUIREMENTS_JSON,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
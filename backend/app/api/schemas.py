@@ -2,8 +2,8 @@
 Pydantic schemas for API request/response models
 """
 
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from datetime import datetime
 
 
@@ -35,6 +35,10 @@ class SearchRequest(BaseModel):
 
 class SearchResponse(BaseModel):
     """Response schema for image search"""
+    # from_attributes lets pydantic build these straight from ORM rows,
+    # so lists of results can be converted in one validator call
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     filename: str
     original_filename: Optional[str] = None
@@ -49,6 +53,12 @@ class SearchResponse(BaseModel):
     onedrive_file_url: Optional[str] = None
     onedrive_download_url: Optional[str] = None
 
+    @field_validator("id", mode="before")
+    @classmethod
+    def _stringify_id(cls, value):
+        """Accept the UUID column value directly from ORM rows"""
+        return str(value)
+
 
 class SearchResultsResponse(BaseModel):
     """Response schema for search results"""
@@ -59,6 +69,21 @@ class SearchResultsResponse(BaseModel):
     radius_m: Optional[float] = None
 
 
+class ChatMessage(BaseModel):
+    """Single message in a chat conversation"""
+    role: Literal["user", "assistant", "system"]
+    content: str
+
+
+class ChatRequest(BaseModel):
+    """Request schema for the chat endpoints"""
+    messages: List[ChatMessage]
+
+    def last_user_message(self) -> Optional[str]:
+        """Content of the most recent user message, if any"""
+        return next((m.content for m in reversed(self.messages) if m.role == "user"), None)
+
+
 class ErrorResponse(BaseModel):
     """Error response schema"""
     error: str
@@ -4,7 +4,7 @@ Database models for the Tool Detection application
 
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Float, DateTime, ARRAY, Text
+from sqlalchemy import Boolean, Column, Computed, ForeignKey, Index, String, Float, DateTime, ARRAY, Text
 from sqlalchemy.dialects.postgresql import UUID
 from geoalchemy2 import Geography
 from app.database.connection import Base
@@ -25,18 +25,36 @@ class Image(Base):
     # AI-generated tags and confidences
     tags = Column(ARRAY(String), nullable=False, default=[])
     confidences = Column(ARRAY(Float), nullable=False, default=[])
+
+    # Stored generated column: the lowercased tag text, maintained by
+    # PostgreSQL on write so substring (ILIKE) searches never rebuild the
+    # concatenation per row. Indexed with gin_trgm_ops in init_db.
+    tags_text = Column(
+        Text, Computed("lower(immutable_array_to_string(tags, ' '))", persisted=True)
+    )
     
     # Location data
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     
-    # PostGIS geography column for spatial queries
-    location = Column(Geography(geometry_type='POINT', srid=4326), nullable=False)
+    # PostGIS geography column for spatial queries, generated from the
+    # lat/lon floats by the database so the two representations can never
+    # drift and inserts don't ship the point twice
+    location = Column(
+        Geography(geometry_type='POINT', srid=4326),
+        Computed("(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))::geography"),
+        nullable=False
+    )
     
     # Metadata
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
+    # Whether the underlying file is still retrievable. Search queries
+    # filter on this in SQL so LIMIT prunes in the database instead of
+    # results being stat()-checked row by row in Python.
+    file_exists = Column(Boolean, nullable=False, default=True, index=True)
+
     # Optional: File size and MIME type
     file_size = Column(Float, nullable=True)
     mime_type = Column(String(100), nullable=True)
@@ -61,9 +79,34 @@ class Image(Base):
             "longitude": self.longitude,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
+            "file_exists": self.file_exists,
             "file_size": self.file_size,
             "mime_type": self.mime_type,
             "onedrive_file_id": self.onedrive_file_id,
             "onedrive_file_url": self.onedrive_file_url,
             "onedrive_download_url": self.onedrive_download_url
         }
+
+
+class ImageTag(Base):
+    """
+    Normalized (image_id, tag) rows, kept in sync by a database trigger.
+
+    The array-plus-GIN approach on images.tags wins at small scale but
+    loses to btree joins once the table grows very large; this table is
+    the scaling path, used by queries when USE_IMAGE_TAGS_TABLE is set.
+    """
+
+    __tablename__ = "image_tags"
+    __table_args__ = (Index("ix_image_tags_tag", "tag"),)
+
+    image_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("images.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    tag = Column(Text, primary_key=True)
+    confidence = Column(Float, nullable=True)
+
+    def __repr__(self):
+        return f"<ImageTag(image_id={self.image_id}, tag='{self.tag}')>"
@@ -2,23 +2,102 @@
 Database query functions for geospatial and text search
 """
 
+import logging
+import os
+import re
+import uuid
+from functools import lru_cache
 from typing import List, Optional, Tuple
-from sqlalchemy import func, and_, or_
-from sqlalchemy.orm import Session
-from app.database.models import Image
+from sqlalchemy import (
+    ARRAY, Row, Select, String, cast, func, insert, lambda_stmt, literal,
+    union_all, update, and_, or_, select
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from geoalchemy2 import Geography
+from app.database.models import Image, ImageTag
 
+logger = logging.getLogger(__name__)
 
-def search_images(
-    db: Session,
+# Scaling switch: at very large row counts the normalized image_tags
+# table (btree join) beats the GIN-on-array plan. Off by default.
+USE_IMAGE_TAGS_TABLE = os.getenv("USE_IMAGE_TAGS_TABLE", "false").lower() in ("1", "true", "yes")
+
+# Columns the search endpoints actually return - everything except the
+# PostGIS geography. Projecting these instead of the mapped entity hands
+# the routes plain Row tuples with no ORM identity-map or instance
+# construction overhead, and the rows validate straight into
+# SearchResponse via from_attributes.
+SEARCH_COLUMNS = (
+    Image.id,
+    Image.filename,
+    Image.original_filename,
+    Image.tags,
+    Image.confidences,
+    Image.latitude,
+    Image.longitude,
+    Image.created_at,
+    Image.file_size,
+    Image.mime_type,
+    Image.onedrive_file_id,
+    Image.onedrive_file_url,
+    Image.onedrive_download_url,
+)
+
+# tsvector over the tag array. This exact expression is covered by the
+# images_tags_fts GIN expression index created in init_db, so tag search
+# is a posting-list lookup instead of a per-row substring scan.
+_TAGS_TSVECTOR = func.to_tsvector('simple', func.immutable_array_to_string(Image.tags, ' '))
+
+
+@lru_cache(maxsize=4096)
+def _expand_terms(terms: Tuple[str, ...]) -> str:
+    """
+    Build the OR-of-words tsquery string for a tuple of terms.
+
+    Terms are reduced to word characters so user input can't break the
+    tsquery syntax, and dict.fromkeys dedups while keeping first-seen
+    order. Memoized: the detector emits the same tag sets over and over,
+    so repeat calls skip the regex and join work entirely.
+    """
+    words = []
+    for term in terms:
+        words.extend(re.findall(r"\w+", term.lower()))
+    return ' | '.join(dict.fromkeys(words))
+
+
+def _tags_match_any(terms: List[str]):
+    """OR-of-terms tsquery filter against the indexed tag vector"""
+    tsquery = _expand_terms(tuple(terms))
+    if not tsquery:
+        return None
+    return _TAGS_TSVECTOR.op('@@')(func.to_tsquery('simple', tsquery))
+
+
+def _within_radius(lat: float, lon: float, radius_m: float):
+    """
+    ST_DWithin filter on the geography column.
+
+    The point is built server-side from bound floats (no WKT string to
+    parse) and the images_location_gist index prunes candidates before any
+    exact distance evaluation. Because lon/lat/radius ride as binds, every
+    radius search compiles to the same SQL text, so SQLAlchemy's compiled
+    cache and asyncpg's prepared statements are hit on every call.
+    """
+    point = cast(func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326), Geography)
+    return func.ST_DWithin(Image.location, point, radius_m)
+
+
+async def search_images(
+    db: AsyncSession,
     query: Optional[str] = None,
     lat: Optional[float] = None,
     lon: Optional[float] = None,
     radius_m: float = 10000,  # 10km default
     limit: int = 50
-) -> List[Image]:
+) -> List[Row]:
     """
     Search images by tag and/or location with location-based prioritization
-    
+
     Args:
         db: Database session
         query: Text query to search in tags
@@ -26,173 +105,321 @@ def search_images(
         lon: Longitude for location-based search
         radius_m: Search radius in meters
         limit: Maximum number of results
-    
+
     Returns:
-        List of matching Image objects, prioritized by location proximity
+        List of matching Rows (SEARCH_COLUMNS), prioritized by location proximity
     """
     try:
-        # Simple text search without complex geospatial queries
-        db_query = db.query(Image)
-        
-        # Text search in tags
+        # Located searches order nearest-first via the image_distance_m
+        # SQL function (defined in init_db); the distance rides along as a
+        # selected label so the fused query below can order on it too
+        if lat is not None and lon is not None:
+            distance = func.image_distance_m(Image.location, lon, lat).label('distance')
+        else:
+            distance = literal(0.0).label('distance')
+
+        def branch(rank: int, match) -> Select:
+            """One ranked arm of the fused search query"""
+            arm = (
+                select(*SEARCH_COLUMNS, literal(rank).label('rank'), distance)
+                .where(Image.file_exists.is_(True), match)
+            )
+            if lat is not None and lon is not None:
+                arm = arm.where(_within_radius(lat, lon, radius_m))
+            return arm.order_by(distance, Image.created_at.desc()).limit(limit)
+
         if query:
+            # One UNION ALL round-trip covers both match strategies:
+            # exact word matches via the FTS GIN index rank first, with
+            # trigram-served substring matches as the built-in fallback
+            # (no second query from the route on failure)
             query_lower = query.lower().strip()
-            # Simple text search in tags
-            db_query = db_query.filter(
-                func.array_to_string(Image.tags, ' ').ilike(f'%{query_lower}%')
+            fts_arm = branch(
+                1, _TAGS_TSVECTOR.op('@@')(func.plainto_tsquery('simple', query_lower))
             )
-        
-        # Simple location filtering if coordinates provided
-        if lat is not None and lon is not None:
-            # Simple lat/lon range filtering (rough approximation)
-            lat_range = radius_m / 111000  # Rough conversion: 1 degree ≈ 111km
-            lon_range = radius_m / (111000 * 0.7)  # Approximate for longitude
-            
-            db_query = db_query.filter(
-                and_(
-                    Image.latitude.between(lat - lat_range, lat + lat_range),
-                    Image.longitude.between(lon - lon_range, lon + lon_range)
-                )
+            fuzzy_arm = branch(2, Image.tags_text.ilike(f'%{query_lower}%'))
+            union = union_all(fts_arm, fuzzy_arm).subquery()
+            stmt = select(union).order_by(
+                union.c.rank, union.c.distance, union.c.created_at.desc()
             )
-        
-        # Order by creation date (newest first)
-        db_query = db_query.order_by(Image.created_at.desc())
-        
-        # Return results directly from database - no file existence check
-        return db_query.limit(limit).all()
-        
-    except Exception as e:
-        print(f"Search failed: {e}")
+
+            result = await db.execute(stmt)
+            # An image matched by both arms appears twice; keep its best
+            # (first-ordered) row. At most 2*limit rows reach Python.
+            seen, rows = set(), []
+            for row in result.all():
+                if row.id not in seen:
+                    seen.add(row.id)
+                    rows.append(row)
+                    if len(rows) == limit:
+                        break
+            return rows
+
+        # No query: plain file_exists + optional radius filter
+        stmt = select(*SEARCH_COLUMNS).where(Image.file_exists.is_(True))
+        if lat is not None and lon is not None:
+            stmt = stmt.where(_within_radius(lat, lon, radius_m))
+        stmt = stmt.order_by(distance, Image.created_at.desc()).limit(limit)
+
+        result = await db.execute(stmt)
+        return list(result.all())
+
+    except Exception:
+        logger.exception("Search failed")
         return []
 
 
-def simple_search_images(db: Session, query: Optional[str] = None, limit: int = 50) -> List[Image]:
+async def get_image_by_id(db: AsyncSession, image_id: str) -> Optional[Image]:
+    """Get a single image by ID"""
+    try:
+        key = uuid.UUID(image_id)
+    except ValueError:
+        # A malformed id can't match anything; fail in Python instead of
+        # asking the database to parse it
+        return None
+
+    # Session.get binds a typed UUID parameter for a primary-key lookup
+    # and answers from the identity map when the row is already loaded
+    return await db.get(Image, key)
+
+
+async def get_images_by_ids(db: AsyncSession, image_ids: List[str]) -> List[Image]:
     """
-    Simple search function without complex geospatial queries
-    Fallback for when the main search function fails
+    Fetch a batch of images in one IN query, preserving caller order.
+
+    List handlers that would otherwise loop get_image_by_id pay one
+    round-trip instead of N; ids that don't exist are simply omitted.
     """
-    try:
-        db_query = db.query(Image)
-        
-        if query:
-            query_lower = query.lower().strip()
-            db_query = db_query.filter(
-                func.array_to_string(Image.tags, ' ').ilike(f'%{query_lower}%')
-            )
-        
-        db_query = db_query.order_by(Image.created_at.desc())
-        
-        # Return results directly from database - no file existence check
-        return db_query.limit(limit).all()
-        
-    except Exception as e:
-        print(f"Simple search failed: {e}")
+    if not image_ids:
         return []
 
+    result = await db.execute(select(Image).where(Image.id.in_(image_ids)))
+    rows = {str(row.id): row for row in result.scalars().all()}
+    return [rows[image_id] for image_id in image_ids if image_id in rows]
 
-def get_image_by_id(db: Session, image_id: str) -> Optional[Image]:
-    """Get a single image by ID"""
-    return db.query(Image).filter(Image.id == image_id).first()
 
+async def get_image_serving_row(db: AsyncSession, image_id: str):
+    """
+    Lean lookup for serving an image file.
+
+    Selects only the columns /images/{id} actually touches, so the tags
+    and confidences arrays and the geography column never leave the
+    database. Returns a Row or None.
+    """
+    # lambda_stmt caches the Core expression tree across calls, so the
+    # per-request cost is just binding image_id - this runs once per image
+    # tile in a results grid
+    stmt = lambda_stmt(lambda: select(
+        Image.filename,
+        Image.mime_type,
+        Image.onedrive_file_id,
+        Image.onedrive_file_url,
+        Image.onedrive_download_url,
+    ).where(Image.id == image_id))
+    result = await db.execute(stmt)
+    return result.first()
 
-def get_images_by_tags(db: Session, tags: List[str], limit: int = 50) -> List[Image]:
+
+async def get_images_by_tags(db: AsyncSession, tags: List[str], limit: int = 50) -> List[Image]:
     """Get images that contain any of the specified tags"""
-    tag_filters = []
-    for tag in tags:
-        tag_filter = func.array_to_string(Image.tags, ' ').ilike(f'%{tag}%')
-        tag_filters.append(tag_filter)
-    
-    if tag_filters:
-        return db.query(Image).filter(or_(*tag_filters)).limit(limit).all()
-    else:
+    if not tags:
         return []
 
+    normalized = [t.lower() for t in tags]
 
-def get_recent_images(db: Session, limit: int = 20) -> List[Image]:
-    """Get most recently uploaded images"""
-    return db.query(Image).order_by(Image.created_at.desc()).limit(limit).all()
+    if USE_IMAGE_TAGS_TABLE:
+        # Star-schema path: btree probe on image_tags(tag) joined back to
+        # images - the plan that keeps winning as the table grows
+        stmt = (
+            select(Image)
+            .join(ImageTag, ImageTag.image_id == Image.id)
+            .where(ImageTag.tag.in_(normalized))
+            .distinct()
+            .limit(limit)
+        )
+        result = await db.execute(stmt)
+        return list(result.scalars().all())
 
+    # Native array overlap against the images_tags_gin index. Tags are
+    # lowercase-normalized at insert time, so exact set intersection works
+    # without any per-row string mangling.
+    overlap = Image.tags.op('&&')(cast(normalized, ARRAY(String)))
+    result = await db.execute(select(Image).where(overlap).limit(limit))
+    return list(result.scalars().all())
 
-def get_images_within_bounds(
-    db: Session,
+
+async def get_recent_images(db: AsyncSession, limit: int = 20) -> List[Row]:
+    """
+    Get most recently uploaded images.
+
+    Returns lean Rows with just the columns the inventory builders read -
+    notably excluding the confidences array and the geography column.
+    """
+    # Fixed-shape statement on the inventory hot path; lambda_stmt reuses
+    # the built expression with just the limit rebound
+    stmt = lambda_stmt(lambda: select(
+        Image.id, Image.filename, Image.tags,
+        Image.latitude, Image.longitude, Image.created_at)
+        .order_by(Image.created_at.desc())
+        .limit(limit))
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+def _recent_unnested_tags(limit: int):
+    """Subquery unnesting the tag arrays of the most recent images"""
+    recent = (
+        select(Image.tags, Image.latitude, Image.longitude, Image.created_at)
+        .order_by(Image.created_at.desc())
+        .limit(limit)
+        .subquery("recent")
+    )
+    return select(
+        func.unnest(recent.c.tags).label("tag"),
+        recent.c.latitude,
+        recent.c.longitude,
+        recent.c.created_at,
+    ).subquery("recent_tags")
+
+
+async def get_tag_counts(db: AsyncSession, limit: int = 100) -> List[Row]:
+    """
+    Tag frequencies over the most recent images, aggregated in SQL.
+
+    unnest + GROUP BY moves the counting into the database, so only one
+    small (tag, count) row per distinct tag crosses the wire instead of
+    every tag array.
+    """
+    tags = _recent_unnested_tags(limit)
+    normalized = func.lower(func.trim(tags.c.tag))
+    stmt = (
+        select(normalized.label("tag"), func.count().label("count"))
+        .group_by(normalized)
+        .order_by(func.count().desc())
+    )
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def get_tag_locations(db: AsyncSession, limit: int = 100) -> List[Row]:
+    """(tag, latitude, longitude, created_at) rows for located recent images"""
+    tags = _recent_unnested_tags(limit)
+    stmt = select(
+        func.lower(func.trim(tags.c.tag)).label("tag"),
+        tags.c.latitude,
+        tags.c.longitude,
+        tags.c.created_at,
+    ).where(tags.c.latitude.isnot(None), tags.c.longitude.isnot(None))
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def get_recent_image_count(db: AsyncSession, limit: int = 100) -> int:
+    """How many of the most recent `limit` image rows actually exist"""
+    recent = select(Image.id).order_by(Image.created_at.desc()).limit(limit).subquery()
+    result = await db.execute(select(func.count()).select_from(recent))
+    return int(result.scalar_one())
+
+
+async def get_images_within_bounds(
+    db: AsyncSession,
     min_lat: float,
     max_lat: float,
     min_lon: float,
     max_lon: float,
     limit: int = 100
-) -> List[Image]:
+) -> List[Row]:
     """Get images within geographic bounds"""
-    bounds_filter = and_(
-        Image.latitude >= min_lat,
-        Image.latitude <= max_lat,
-        Image.longitude >= min_lon,
-        Image.longitude <= max_lon
+    # One envelope probe of the images_location_gist index instead of two
+    # float range scans that no spatial index can serve
+    envelope = cast(
+        func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326), Geography
     )
-    
-    return db.query(Image).filter(bounds_filter).limit(limit).all()
+    bounds_filter = func.ST_Intersects(Image.location, envelope)
+
+    result = await db.execute(select(*SEARCH_COLUMNS).where(bounds_filter).limit(limit))
+    return list(result.all())
 
 
-def search_images_by_tags(db: Session, search_tags: List[str], lat: Optional[float] = None, 
-                          lon: Optional[float] = None, radius_m: float = 10000, limit: int = 50) -> List[Image]:
+async def refresh_file_exists(db: AsyncSession, present_filenames: set) -> int:
+    """
+    Reconcile the file_exists flags against one directory listing.
+
+    The caller scans UPLOAD_DIR once (a single batched syscall via
+    os.scandir) and passes the filenames found; this flips only the rows
+    whose flag disagrees. Rows with a OneDrive copy are never marked
+    missing, since they can still be served remotely. Returns the number
+    of rows changed.
+    """
+    marked_missing = await db.execute(
+        update(Image)
+        .where(
+            Image.filename.notin_(present_filenames),
+            Image.onedrive_file_id.is_(None),
+            Image.file_exists.is_(True),
+        )
+        .values(file_exists=False)
+    )
+    restored = await db.execute(
+        update(Image)
+        .where(Image.filename.in_(present_filenames), Image.file_exists.is_(False))
+        .values(file_exists=True)
+    )
+    await db.commit()
+    return (marked_missing.rowcount or 0) + (restored.rowcount or 0)
+
+
+async def insert_images(db: AsyncSession, rows: List[dict]) -> List[Row]:
+    """
+    Insert a batch of image rows in one statement.
+
+    The bulk counterpart to the single-row insert in the upload routes:
+    one multi-VALUES INSERT ... RETURNING round trip instead of one
+    statement per image, for callers that ingest several detections at
+    once (e.g. results from detect_tools_batch). The image_tags sync
+    trigger fires per row inside the same statement, and RETURNING hands
+    back the generated (id, created_at) pairs in input order.
+    """
+    if not rows:
+        return []
+    result = await db.execute(
+        insert(Image).values(rows).returning(Image.id, Image.created_at)
+    )
+    await db.commit()
+    return list(result.all())
+
+
+async def search_images_by_tags(db: AsyncSession, search_tags: List[str], lat: Optional[float] = None,
+                                lon: Optional[float] = None, radius_m: float = 10000, limit: int = 50) -> List[Row]:
     """
     Search images by AI-generated tags with ultra-permissive matching
     """
-    import os
-    
     filters = []
-    
-    # Create all possible search terms from AI tags
-    all_search_terms = set()
-    
-    # Add original tags
-    all_search_terms.update(search_tags)
-    
-    # Add individual words from each tag
-    for tag in search_tags:
-        clean_tag = tag.lower().replace('-', ' ').replace('_', ' ').replace(',', ' ')
-        words = [w.strip() for w in clean_tag.split() if len(w.strip()) > 1]
-        all_search_terms.update(words)
-    
-    print(f"Database search terms: {all_search_terms}")
-    
-    # Create OR filters for all search terms
-    search_filters = []
-    
-    for term in all_search_terms:
-        term_lower = term.lower()
-        
-        # Search in concatenated tags (space-separated)
-        search_filters.append(func.array_to_string(Image.tags, ' ').ilike(f'%{term_lower}%'))
-        
-        # Search in concatenated tags (comma-separated)
-        search_filters.append(func.array_to_string(Image.tags, ',').ilike(f'%{term_lower}%'))
-    
-    if search_filters:
-        filters.append(or_(*search_filters))
-    
-    # Location-based search (simplified)
+
+    # A single OR-of-words tsquery replaces the old 2xN ILIKE clauses:
+    # _tags_match_any splits every tag into words, so an image matches if
+    # it shares any word with the detected tags, and one GIN probe answers
+    # all terms at once.
+    match_filter = _tags_match_any(search_tags)
+    if match_filter is not None:
+        filters.append(match_filter)
+
+    # Accurate indexed radius filtering on the geography column
     if lat is not None and lon is not None:
-        # Simple lat/lon range filtering (rough approximation)
-        lat_range = radius_m / 111000  # Rough conversion: 1 degree ≈ 111km
-        lon_range = radius_m / (111000 * 0.7)  # Approximate for longitude
-        
-        location_filter = and_(
-            Image.latitude.between(lat - lat_range, lat + lat_range),
-            Image.longitude.between(lon - lon_range, lon + lon_range)
-        )
-        filters.append(location_filter)
-    
+        filters.append(_within_radius(lat, lon, radius_m))
+
     # Build query
-    db_query = db.query(Image)
-    
+    stmt = select(*SEARCH_COLUMNS).where(Image.file_exists.is_(True))
+
     if filters:
-        db_query = db_query.filter(and_(*filters))
-    
+        stmt = stmt.where(and_(*filters))
+
     # Order by creation date (most recent first)
-    db_query = db_query.order_by(Image.created_at.desc())
-    
+    stmt = stmt.order_by(Image.created_at.desc()).limit(limit)
+
     # Get results directly from database - no file existence check needed
-    results = db_query.limit(limit).all()
-    
-    print(f"Database query returned {len(results)} results")
+    result = await db.execute(stmt)
+    results = list(result.all())
+
+    logger.debug("Database query returned %d results", len(results))
     return results
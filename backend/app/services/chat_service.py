@@ -5,22 +5,34 @@ Provides conversational AI with inventory awareness and task assistance
 
 import os
 import json
+import logging
+import re
 import asyncio
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from app.database.connection import get_db
-from app.database.queries import get_recent_images, get_images_by_tags, search_images
+from dataclasses import dataclass, field
+from string import Template
+from typing import Final, List, Dict, Any, Optional
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import get_db, SessionLocal
+from app.database.queries import (
+    get_recent_images, get_images_by_tags, search_images,
+    get_tag_counts, get_tag_locations, get_recent_image_count
+)
 # from app.services.gemini_service import GeminiService
 
+logger = logging.getLogger(__name__)
 
-class ChatService:
-    def __init__(self):
-        # self.gemini_service = GeminiService()
-        self.system_prompt = self._get_system_prompt()
-    
-    def _get_system_prompt(self) -> str:
-        """Get the system prompt for the AI assistant"""
-        return """You are a helpful tool assistant for a construction/DIY tool management app. You help users with:
+
+# The inventory is rebuilt from the images table on every chat/inventory
+# request, but the data only changes when an upload lands - cache it
+# briefly and drop it whenever a new image is saved. Single-user app, so
+# one shared cache entry.
+_inventory_cache: TTLCache = TTLCache(maxsize=1, ttl=30)
+_INVENTORY_CACHE_KEY = "inventory"
+
+# System prompt for the AI assistant - a constant, so build it once at
+# import rather than per ChatService instance
+_SYSTEM_PROMPT: Final[str] = """You are a helpful tool assistant for a construction/DIY tool management app. You help users with:
 
 1. **Tool Inventory Management**: Answer questions about what tools they have, quantities, and locations
 2. **Task Planning**: Help plan projects by identifying required tools and checking availability
@@ -48,79 +60,131 @@ class ChatService:
 
 Remember: You have access to the user's tool inventory, so always check what they have before making recommendations."""
 
-    async def get_user_inventory(self, db: Session) -> Dict[str, Any]:
+
+def invalidate_inventory_cache() -> None:
+    """Drop the cached inventory (called after an image is saved)"""
+    _inventory_cache.pop(_INVENTORY_CACHE_KEY, None)
+
+
+# Task-plan skeleton, compiled once at import. Only the task name and
+# the tool sections vary per request; the static steps/safety text never
+# gets re-concatenated.
+_PLAN_TEMPLATE: Final[Template] = Template(
+    "**Task Plan: $task**\n\n"
+    "$tool_sections"
+    "\n**📋 Steps:**\n"
+    "1. Gather all required tools\n"
+    "2. Prepare your workspace\n"
+    "3. Follow safety guidelines\n"
+    "4. Complete the task step by step\n"
+    "5. Clean up and store tools\n\n"
+    "**⚠️ Safety First:** Always wear appropriate safety gear and follow proper procedures!"
+)
+
+
+@dataclass(slots=True)
+class ToolInfo:
+    """
+    Per-tool aggregate built while scanning search results.
+
+    Slotted fixed layout: attribute access skips the per-entry hash
+    table a plain dict would carry, and each instance is a fraction of
+    the size.
+    """
+    count: int = 0
+    locations: List[Dict[str, float]] = field(default_factory=list)
+    confidence: float = 0.0
+
+
+class ChatService:
+    def __init__(self):
+        # self.gemini_service = GeminiService()
+        self.system_prompt = _SYSTEM_PROMPT
+        # Compiled once: each intent is one DFA pass over the message
+        # instead of a Python substring scan per keyword. Plain
+        # alternations, no word boundaries - the original checks were
+        # substring matches, so "planning"/"fixing"/"suggestions" must
+        # keep hitting their intents.
+        self._re_inventory = re.compile(
+            r'how many|what tools|inventory|tools do i have', re.IGNORECASE
+        )
+        self._re_task = re.compile(
+            r'how to|plan|task|project|install|build|fix', re.IGNORECASE
+        )
+        self._re_recommend = re.compile(
+            r'recommend|suggest|need for|tools for', re.IGNORECASE
+        )
+    
+    async def get_user_inventory(self, db: AsyncSession) -> Dict[str, Any]:
         """Get user's tool inventory with counts and locations"""
         try:
-            # Get recent images (last 100)
-            recent_images = get_recent_images(db, limit=100)
-            
-            # Count tools by type
-            tool_counts = {}
+            cached = _inventory_cache.get(_INVENTORY_CACHE_KEY)
+            if cached is not None:
+                return cached
+
+            # Counting happens in SQL via unnest + GROUP BY over the last
+            # 100 images, so only aggregated rows cross the wire and the
+            # per-image/per-tag Python loop is gone
+            tool_counts = {
+                row.tag: row.count for row in await get_tag_counts(db, limit=100) if row.tag
+            }
+
             tool_locations = {}
-            
-            for image in recent_images:
-                if image.tags:
-                    for tag in image.tags:
-                        tool_name = tag.lower().strip()
-                        if tool_name:
-                            tool_counts[tool_name] = tool_counts.get(tool_name, 0) + 1
-                            
-                            # Store location info
-                            if image.latitude and image.longitude:
-                                location_key = f"{image.latitude:.4f},{image.longitude:.4f}"
-                                if tool_name not in tool_locations:
-                                    tool_locations[tool_name] = []
-                                tool_locations[tool_name].append({
-                                    'location': location_key,
-                                    'timestamp': image.created_at.isoformat() if image.created_at else None
-                                })
-            
-            return {
+            for row in await get_tag_locations(db, limit=100):
+                if row.tag and row.latitude and row.longitude:
+                    tool_locations.setdefault(row.tag, []).append({
+                        'location': f"{row.latitude:.4f},{row.longitude:.4f}",
+                        'timestamp': row.created_at.isoformat() if row.created_at else None
+                    })
+
+            inventory = {
                 'total_tools': len(tool_counts),
                 'tool_counts': tool_counts,
                 'tool_locations': tool_locations,
-                'recent_uploads': len(recent_images)
+                'recent_uploads': await get_recent_image_count(db, limit=100)
             }
-        except Exception as e:
-            print(f"Error getting user inventory: {e}")
+            _inventory_cache[_INVENTORY_CACHE_KEY] = inventory
+            return inventory
+        except Exception:
+            logger.exception("Error getting user inventory")
             return {'total_tools': 0, 'tool_counts': {}, 'tool_locations': {}, 'recent_uploads': 0}
 
-    async def get_tools_for_task(self, db: Session, task_description: str) -> Dict[str, Any]:
+    async def get_tools_for_task(self, db: AsyncSession, task_description: str) -> Dict[str, ToolInfo]:
         """Get tools needed for a specific task"""
         try:
             # Search for relevant tools in inventory
-            search_results = search_images(db, query=task_description, limit=50)
+            search_results = await search_images(db, query=task_description, limit=50)
             
             relevant_tools = {}
             for image in search_results:
-                if image.tags:
-                    for tag in image.tags:
-                        tool_name = tag.lower().strip()
-                        if tool_name:
-                            if tool_name not in relevant_tools:
-                                relevant_tools[tool_name] = {
-                                    'count': 0,
-                                    'locations': [],
-                                    'confidence': 0
-                                }
-                            relevant_tools[tool_name]['count'] += 1
-                            if image.latitude and image.longitude:
-                                relevant_tools[tool_name]['locations'].append({
-                                    'lat': image.latitude,
-                                    'lon': image.longitude
-                                })
-                            if image.confidences:
-                                relevant_tools[tool_name]['confidence'] = max(
-                                    relevant_tools[tool_name]['confidence'],
-                                    max(image.confidences) if image.confidences else 0
-                                )
-            
+                if not image.tags:
+                    continue
+                # Per-image values are loop-invariant across the image's
+                # tags - compute them once instead of per tag
+                best_confidence = max(image.confidences) if image.confidences else 0
+                location = (
+                    {'lat': image.latitude, 'lon': image.longitude}
+                    if image.latitude and image.longitude else None
+                )
+                for tag in image.tags:
+                    tool_name = tag.lower().strip()
+                    if not tool_name:
+                        continue
+                    tool_info = relevant_tools.get(tool_name)
+                    if tool_info is None:
+                        tool_info = relevant_tools[tool_name] = ToolInfo()
+                    tool_info.count += 1
+                    if location:
+                        tool_info.locations.append(location)
+                    if best_confidence > tool_info.confidence:
+                        tool_info.confidence = best_confidence
+
             return relevant_tools
-        except Exception as e:
-            print(f"Error getting tools for task: {e}")
+        except Exception:
+            logger.exception("Error getting tools for task")
             return {}
 
-    async def generate_response(self, user_message: str, db: Session) -> str:
+    async def generate_response(self, user_message: str, db: AsyncSession) -> str:
         """Generate AI response with inventory context"""
         try:
             # Get user's inventory
@@ -141,48 +205,48 @@ Please provide a helpful response based on their inventory and question. If they
             response = await self._generate_simple_response(user_message, inventory)
             return response
             
-        except Exception as e:
-            print(f"Error generating response: {e}")
+        except Exception:
+            logger.exception("Error generating response")
             return "I'm sorry, I encountered an error while processing your request. Please try again."
 
     def _format_inventory_context(self, inventory: Dict[str, Any]) -> str:
         """Format inventory data for the AI context"""
         if inventory['total_tools'] == 0:
             return "No tools found in inventory."
-        
-        context = f"Total tools in inventory: {inventory['total_tools']}\n\n"
-        context += "Tool inventory:\n"
-        
+
+        # Collect lines and join once - repeated += reallocates the whole
+        # string per tool, which goes quadratic on large inventories
+        tool_locations = inventory['tool_locations']
+        lines = [f"Total tools in inventory: {inventory['total_tools']}\n", "Tool inventory:"]
         for tool_name, count in inventory['tool_counts'].items():
-            context += f"- {tool_name}: {count} available\n"
-            if tool_name in inventory['tool_locations']:
-                locations = inventory['tool_locations'][tool_name]
-                if locations:
-                    context += f"  Locations: {len(locations)} different locations\n"
-        
-        return context
+            lines.append(f"- {tool_name}: {count} available")
+            locations = tool_locations.get(tool_name)
+            if locations:
+                lines.append(f"  Locations: {len(locations)} different locations")
+        lines.append("")
+        return "\n".join(lines)
 
     async def _generate_simple_response(self, user_message: str, inventory: Dict[str, Any]) -> str:
         """Generate a simple response without external AI service"""
-        message_lower = user_message.lower()
-        
         # Check for inventory questions
-        if any(word in message_lower for word in ['how many', 'what tools', 'inventory', 'tools do i have']):
+        if self._re_inventory.search(user_message):
             if inventory['total_tools'] == 0:
                 return "You don't have any tools in your inventory yet. Try uploading some tool images to get started!"
             
-            response = f"You have **{inventory['total_tools']}** tools in your inventory:\n\n"
-            for tool_name, count in inventory['tool_counts'].items():
-                response += f"✅ **{tool_name}**: {count} available\n"
-            
-            return response
+            lines = [f"You have **{inventory['total_tools']}** tools in your inventory:\n"]
+            lines.extend(
+                f"✅ **{tool_name}**: {count} available"
+                for tool_name, count in inventory['tool_counts'].items()
+            )
+            lines.append("")
+            return "\n".join(lines)
         
         # Check for task planning questions
-        elif any(word in message_lower for word in ['how to', 'plan', 'task', 'project', 'install', 'build', 'fix']):
+        elif self._re_task.search(user_message):
             return f"I'd be happy to help you plan that task! Based on your inventory of **{inventory['total_tools']}** tools, I can help you figure out what you need. Could you provide more details about the specific task you want to accomplish?"
         
         # Check for tool recommendations
-        elif any(word in message_lower for word in ['recommend', 'suggest', 'need for', 'tools for']):
+        elif self._re_recommend.search(user_message):
             return f"Based on your current inventory of **{inventory['total_tools']}** tools, I can help recommend what you might need. What specific type of work or project are you planning?"
         
         # Default response
@@ -191,29 +255,24 @@ Please provide a helpful response based on their inventory and question. If they
 
     async def _generate_task_plan(self, task_description: str, available_tools: List[Dict], missing_tools: List[str]) -> str:
         """Generate a simple task plan"""
-        plan = f"**Task Plan: {task_description}**\n\n"
-        
+        sections = []
+
         if available_tools:
-            plan += "**✅ Available Tools:**\n"
-            for tool in available_tools:
-                plan += f"• {tool['name']} ({tool['count']} available)\n"
-        
+            sections.append("**✅ Available Tools:**\n")
+            sections.extend(
+                f"• {tool['name']} ({tool['count']} available)\n" for tool in available_tools
+            )
+
         if missing_tools:
-            plan += "\n**❌ Missing Tools:**\n"
-            for tool in missing_tools:
-                plan += f"• {tool}\n"
-        
-        plan += "\n**📋 Steps:**\n"
-        plan += "1. Gather all required tools\n"
-        plan += "2. Prepare your workspace\n"
-        plan += "3. Follow safety guidelines\n"
-        plan += "4. Complete the task step by step\n"
-        plan += "5. Clean up and store tools\n\n"
-        plan += "**⚠️ Safety First:** Always wear appropriate safety gear and follow proper procedures!"
-        
-        return plan
+            sections.append("\n**❌ Missing Tools:**\n")
+            sections.extend(f"• {tool}\n" for tool in missing_tools)
 
-    async def generate_streaming_response(self, user_message: str, db: Session):
+        return _PLAN_TEMPLATE.substitute(
+            task=task_description,
+            tool_sections="".join(sections)
+        )
+
+    async def generate_streaming_response(self, user_message: str, db: AsyncSession):
         """Generate streaming response with inventory context"""
         try:
             # Get user's inventory
@@ -230,38 +289,47 @@ User Question: {user_message}
 
 Please provide a helpful response based on their inventory and question. If they're asking about a specific task, check what tools they have available and what they might need."""
 
-            # Stream response from simple AI (fallback)
+            # The local responder produces the full text at once, so yield
+            # it in coarse chunks with no artificial delay - the 50ms-per-
+            # word pacing only added word_count * 50ms of latency. When a
+            # real model backs this path, its token iterator plugs in here
+            # and the SSE plumbing upstream flushes chunks as they arrive.
             response = await self._generate_simple_response(user_message, inventory)
-            # Simulate streaming by yielding chunks
-            words = response.split()
-            for i, word in enumerate(words):
-                yield word + " "
-                await asyncio.sleep(0.05)  # Small delay for streaming effect
-                
-        except Exception as e:
-            print(f"Error generating streaming response: {e}")
+            for start in range(0, len(response), 256):
+                yield response[start:start + 256]
+
+        except Exception:
+            logger.exception("Error generating streaming response")
             yield "I'm sorry, I encountered an error while processing your request. Please try again."
 
-    async def plan_task(self, task_description: str, db: Session) -> Dict[str, Any]:
+    async def plan_task(self, task_description: str, db: AsyncSession) -> Dict[str, Any]:
         """Plan a task with tool requirements and availability"""
         try:
-            # Get tools needed for the task
-            relevant_tools = await self.get_tools_for_task(db, task_description)
-            
-            # Get full inventory
-            inventory = await self.get_user_inventory(db)
+            # The task search and the inventory fetch are independent, so
+            # run them concurrently. An AsyncSession can't execute two
+            # statements at once, so the inventory side gets its own
+            # short-lived session (it usually hits the 30s cache without
+            # touching the DB at all).
+            async def _inventory_with_own_session():
+                async with SessionLocal() as side_db:
+                    return await self.get_user_inventory(side_db)
+
+            relevant_tools, inventory = await asyncio.gather(
+                self.get_tools_for_task(db, task_description),
+                _inventory_with_own_session(),
+            )
             
             # Analyze what's available vs needed
             available_tools = []
             missing_tools = []
             
             for tool_name, tool_info in relevant_tools.items():
-                if tool_info['count'] > 0:
+                if tool_info.count > 0:
                     available_tools.append({
                         'name': tool_name,
-                        'count': tool_info['count'],
-                        'locations': tool_info['locations'],
-                        'confidence': tool_info['confidence']
+                        'count': tool_info.count,
+                        'locations': tool_info.locations,
+                        'confidence': tool_info.confidence
                     })
                 else:
                     missing_tools.append(tool_name)
@@ -278,8 +346,8 @@ Please provide a helpful response based on their inventory and question. If they
                 'total_missing': len(missing_tools)
             }
             
-        except Exception as e:
-            print(f"Error planning task: {e}")
+        except Exception:
+            logger.exception("Error planning task")
             return {
                 'task': task_description,
                 'available_tools': [],
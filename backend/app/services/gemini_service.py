@@ -6,17 +6,50 @@ It offers cloud-based AI processing as an alternative to local models.
 """
 
 import os
-import json
+import asyncio
+import hashlib
 import logging
-from typing import List, Tuple, Optional
+import re
+from typing import Dict, Final, List, Tuple, Optional
+import httpx
+import orjson
+from cachetools import TTLCache
 from google import genai
 from google.genai import types
-import requests
+import aiofiles
 from PIL import Image
 import io
 
 logger = logging.getLogger(__name__)
 
+# Strips leading/trailing markdown code fences (``` or ```json) in one
+# pass. The old chained .replace() calls made three passes and mangled
+# any tag containing the substring "json".
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+
+# Keyword scan for the non-JSON fallback parser: one compiled regex pass
+# per line/word instead of nested substring checks
+_TOOL_WORD_RE = re.compile(r'tool|hammer|drill|wrench|saw', re.IGNORECASE)
+
+# Constant prompt, built once at import instead of per detection call
+_TOOL_DETECTION_PROMPT: Final[str] = """
+        You are an AI vision model trained to identify construction-related tools, hardware, and equipment from images.
+
+        Analyze the given image and return all visible **construction tools, hardware, or equipment** — including any items used for **building, renovation, plumbing, electrical work, woodworking, landscaping, grass cutting, or lawn maintenance** commonly found in the United States.
+
+        Your task:
+        - Identify and label each item as specifically as possible.
+        - Include the **brand name, tool model, and full tool name** (for example: “Milwaukee M12 FUEL 12V Lithium-Ion Brushless Cordless 1/4 in. Hex Impact Driver (Tool-Only)” or “DEWALT 20V MAX XR Cordless Brushless 1/4 in. 3-Speed Impact Driver”).
+        - Exclude any **people, vehicles, furniture, packaging, or irrelevant background objects.**
+        - Focus **only** on actual construction tools, hardware, and work equipment.
+        - Do not include generic or vague labels like “tool” or “machine.”
+
+        Return the result **strictly in the following JSON format** (no explanations, no extra text):
+
+        {tags: [specific tool names with brand and model]}
+
+        """
+
 
 class GeminiToolDetector:
     """Tool detection service using Google Gemini"""
@@ -31,102 +64,199 @@ class GeminiToolDetector:
             self.client = None
         else:
             try:
-                self.client = genai.Client(api_key=self.api_key)
+                # One long-lived, pooled HTTP client for the detector's
+                # lifetime: keep-alive connections skip the TCP + TLS
+                # handshake on every call after the first, and the pool is
+                # wide enough for a full detect_tools_batch fan-out. The
+                # SDK owns the client it builds from these args, so its
+                # lifecycle follows the (singleton) detector's.
+                self.client = genai.Client(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(
+                        timeout=30_000,
+                        async_client_args={
+                            "limits": httpx.Limits(
+                                max_connections=64,
+                                max_keepalive_connections=32,
+                            ),
+                        },
+                    ),
+                )
                 logger.info("Gemini client initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Gemini client: {e}")
                 self.client = None
-    
+
+        # Content-addressed result cache: identical bytes (retries,
+        # re-uploads of the same photo) skip the whole billed Gemini
+        # round-trip. Keyed by digest so the cache never pins the image
+        # bytes themselves.
+        self._result_cache: TTLCache = TTLCache(maxsize=512, ttl=86400)
+
+        # Single-flight map: concurrent detections of identical bytes
+        # (frontend retries, previews) await the one in-flight call
+        # instead of each paying for their own. Single event loop, so no
+        # lock is needed around it.
+        self._inflight: Dict[str, asyncio.Future] = {}
+
     def is_available(self) -> bool:
         """Check if Gemini service is available"""
         return self.client is not None
     
-    def detect_tools(self, image_path: str) -> Tuple[List[str], List[float]]:
+    async def detect_tools(self, image_path: str) -> Tuple[List[str], List[float]]:
         """
-        Detect tools in an image using Gemini
-        
+        Detect tools in an image file using Gemini
+
         Args:
             image_path: Path to the image file
-            
+
+        Returns:
+            Tuple of (tags, confidences)
+        """
+        # Load image
+        image_bytes = await self._load_image(image_path)
+        if not image_bytes:
+            return [], []
+
+        return await self.detect_tools_from_bytes(image_bytes)
+
+    async def detect_tools_from_bytes(self, image_bytes: bytes) -> Tuple[List[str], List[float]]:
+        """
+        Detect tools in an in-memory image using Gemini
+
+        Args:
+            image_bytes: Raw image bytes (no disk round-trip needed)
+
         Returns:
             Tuple of (tags, confidences)
         """
         if not self.is_available():
             logger.error("Gemini service not available")
             return [], []
-        
+
+        cache_key = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Gemini result cache hit - skipping inference")
+            return cached
+
+        # Coalesce concurrent calls for the same bytes onto one request
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            logger.info("Joining in-flight Gemini call for identical image")
+            return await inflight
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            result = await self._detect_uncached(image_bytes, cache_key)
+            future.set_result(result)
+            return result
+        except BaseException:
+            # _detect_uncached swallows errors, so only cancellation
+            # lands here - wake the waiters rather than hanging them
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(cache_key, None)
+
+    async def _detect_uncached(self, image_bytes: bytes, cache_key: str) -> Tuple[List[str], List[float]]:
+        """Run the actual Gemini call and fill the result cache"""
         try:
-            # Load image
-            image_bytes = self._load_image(image_path)
-            if not image_bytes:
-                return [], []
-            
             # Create image part for Gemini
             image = types.Part.from_bytes(
                 data=image_bytes, 
                 mime_type="image/jpeg"
             )
             
-            # Create prompt for construction tool analysis
-            prompt = self._create_tool_detection_prompt()
-            
-            # Send request to Gemini
+            # Constant prompt for construction tool analysis
+            prompt = _TOOL_DETECTION_PROMPT
+
+            # Send request to Gemini over the async client so the event
+            # loop keeps serving other requests during the round-trip
             logger.info("Sending request to Gemini for tool detection...")
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model_name,
                 contents=[prompt, image],
             )
-            response_text = response.text.replace("```", "").replace("json", "").strip()
+            response_text = _FENCE_RE.sub("", response.text).strip()
             # Parse response
             tags, confidences = self._parse_gemini_response(response_text)
             
-            logger.info(f"Gemini detected {len(tags)} tools")
-            print(tags)
-            for i, tag in enumerate(tags):
-                logger.info(f"Gemini #{i+1}: {tag}")
-            
+            # One lazy %s-formatted line instead of a print plus a
+            # logger call per tag
+            logger.info("Gemini detected %d tools: %s", len(tags), tags)
+
+            # Only cache hits - an empty result usually means a transient
+            # failure upstream, and caching it would suppress retries
+            if tags:
+                self._result_cache[cache_key] = (tags, confidences)
             return tags, confidences
             
         except Exception as e:
             logger.error(f"Error in Gemini tool detection: {e}")
             return [], []
-    
-    def _load_image(self, image_path: str) -> Optional[bytes]:
-        """Load image from file and return as bytes"""
-        try:
-            with open(image_path, "rb") as image_file:
-                return image_file.read()
-        except Exception as e:
-            logger.error(f"Error loading image: {e}")
-            return None
-    
-    def _create_tool_detection_prompt(self) -> str:
-        """Create the prompt for tool detection"""
-        return """
-        You are an AI vision model trained to identify construction-related tools, hardware, and equipment from images.
 
-        Analyze the given image and return all visible **construction tools, hardware, or equipment** — including any items used for **building, renovation, plumbing, electrical work, woodworking, landscaping, grass cutting, or lawn maintenance** commonly found in the United States.
+    async def detect_tools_batch(self, image_paths: List[str]) -> List[Tuple[List[str], List[float]]]:
+        """
+        Detect tools in several images concurrently using Gemini
 
-        Your task:
-        - Identify and label each item as specifically as possible.
-        - Include the **brand name, tool model, and full tool name** (for example: “Milwaukee M12 FUEL 12V Lithium-Ion Brushless Cordless 1/4 in. Hex Impact Driver (Tool-Only)” or “DEWALT 20V MAX XR Cordless Brushless 1/4 in. 3-Speed Impact Driver”).
-        - Exclude any **people, vehicles, furniture, packaging, or irrelevant background objects.**
-        - Focus **only** on actual construction tools, hardware, and work equipment.
-        - Do not include generic or vague labels like “tool” or “machine.”
+        One image still means one model call, but the calls go out in
+        parallel over the async client instead of paying the full network
+        round trip N times in sequence. Concurrency is capped so a large
+        batch doesn't trip API rate limits.
 
-        Return the result **strictly in the following JSON format** (no explanations, no extra text):
+        Args:
+            image_paths: Paths to the image files
 
-        {tags: [specific tool names with brand and model]}
-        
+        Returns:
+            List of (tags, confidences) tuples, one per input path, in
+            input order. Failed images yield ([], []).
         """
+        if not self.is_available():
+            logger.error("Gemini service not available")
+            return [([], []) for _ in image_paths]
+
+        semaphore = asyncio.Semaphore(8)
+
+        async def detect_one(image_path: str) -> Tuple[List[str], List[float]]:
+            image_bytes = await self._load_image(image_path)
+            if not image_bytes:
+                return [], []
+            async with semaphore:
+                return await self.detect_tools_from_bytes(image_bytes)
+
+        logger.info(f"Sending {len(image_paths)} concurrent requests to Gemini...")
+        results = await asyncio.gather(
+            *(detect_one(path) for path in image_paths),
+            return_exceptions=True,
+        )
+
+        parsed: List[Tuple[List[str], List[float]]] = []
+        for path, result in zip(image_paths, results):
+            if isinstance(result, Exception):
+                logger.error(f"Gemini batch detection failed for {path}: {result}")
+                parsed.append(([], []))
+            else:
+                parsed.append(result)
+        return parsed
+
+    async def _load_image(self, image_path: str) -> Optional[bytes]:
+        """Load image from file without blocking the event loop"""
+        try:
+            async with aiofiles.open(image_path, "rb") as image_file:
+                return await image_file.read()
+        except Exception as e:
+            logger.error(f"Error loading image: {e}")
+            return None
     
     def _parse_gemini_response(self, response_text: str) -> Tuple[List[str], List[float]]:
         """Parse Gemini response and extract tools"""
         tags = []
         
         try:
-            # Try to parse as JSON
-            data = json.loads(response_text)
+            # Try to parse as JSON (orjson: C-level parse, native types)
+            data = orjson.loads(response_text)
 
             if "tags" in data and isinstance(data["tags"], list):
                 # Extract tags directly from the simple JSON format
@@ -134,23 +264,22 @@ class GeminiToolDetector:
                 logger.info(f"Extracted {len(tags)} tags from JSON response")
             else:
                 logger.warning("No 'tags' array found in JSON response")
-                    
-        except json.JSONDecodeError:
+
+        except orjson.JSONDecodeError:
             # If not JSON, try to extract tool names from text
             logger.warning("Failed to parse JSON response, attempting text extraction")
-            lines = response_text.split('\n')
-            for line in lines:
+            for line in response_text.split('\n'):
                 line = line.strip()
-                if line and ('tool' in line.lower() or 'hammer' in line.lower() or 'drill' in line.lower()):
+                if line and _TOOL_WORD_RE.search(line):
                     # Extract potential tool names
-                    words = line.split()
-                    for word in words:
-                        if any(tool_word in word.lower() for tool_word in ['tool', 'hammer', 'drill', 'wrench', 'saw']):
+                    for word in line.split():
+                        if _TOOL_WORD_RE.search(word):
                             tags.append(word.strip('.,!?'))
                             break
         
-        # Remove duplicates and empty strings
-        unique_tags = list(set([tag for tag in tags if tag]))
+        # Remove duplicates and empty strings, keeping first-seen order so
+        # results stay deterministic for identical responses
+        unique_tags = list(dict.fromkeys(tag for tag in tags if tag))
         
         # Create dummy confidence scores (all 1.0 since we're not using confidence)
         confidences = [1.0] * len(unique_tags)
@@ -0,0 +1,57 @@
+"""
+Request-scoped batching loader for image lookups
+
+Coalesces image-by-id lookups awaited within the same event-loop tick
+into a single WHERE id IN (...) query, avoiding the N+1 pattern when a
+client fans out over /images/{id} and /images/{id}/info.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Image
+from app.database.queries import get_images_by_ids
+
+
+class ImageLoader:
+    """Batches concurrent image-by-id lookups into one IN query"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_scheduled = False
+
+    async def load(self, image_id: str) -> Optional[Image]:
+        """Resolve an image by ID, sharing one query with concurrent loads"""
+        future = self._pending.get(image_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[image_id] = future
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                # Scheduled as a task so loads awaited in the same tick have
+                # already queued up by the time the query runs
+                asyncio.get_running_loop().call_soon(
+                    lambda: asyncio.ensure_future(self._flush())
+                )
+        return await future
+
+    async def _flush(self):
+        """Run one IN query for everything queued since the last flush"""
+        pending, self._pending = self._pending, {}
+        self._flush_scheduled = False
+        if not pending:
+            return
+
+        try:
+            images = await get_images_by_ids(self.db, list(pending))
+            images_by_id = {str(image.id): image for image in images}
+            for image_id, future in pending.items():
+                if not future.done():
+                    future.set_result(images_by_id.get(image_id))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
@@ -2,6 +2,7 @@
 OneDrive integration service for storing images in OneDrive instead of local storage
 """
 
+import logging
 import os
 import requests
 import json
@@ -11,6 +12,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class OneDriveService:
     """Service for uploading files to OneDrive using Microsoft Graph API"""
@@ -27,6 +30,11 @@ class OneDriveService:
         self.sharepoint_site_id = os.getenv("SHARE_POINT_SITE_ID")
         self.sharepoint_folder = "ToolDetectionImages"
         
+        # Local fallback storage - created once here instead of stat+mkdir
+        # on every fallback upload
+        self.uploads_dir = "uploads"
+        os.makedirs(self.uploads_dir, exist_ok=True)
+
         # Token management
         self.token_expires_at = None
         self._refresh_token_if_needed()
@@ -42,7 +50,7 @@ class OneDriveService:
             return self._get_new_access_token()
             
         except Exception as e:
-            print(f"Token refresh error: {e}")
+            logger.error(f"Token refresh error: {e}")
             return False
     
     def _is_token_expired(self) -> bool:
@@ -57,7 +65,7 @@ class OneDriveService:
         """Get a new access token using client credentials flow"""
         try:
             if not all([self.client_id, self.client_secret, self.tenant_id]):
-                print("❌ Missing Azure credentials for token refresh")
+                logger.error("Missing Azure credentials for token refresh")
                 return False
             
             # Microsoft Graph token endpoint
@@ -71,7 +79,7 @@ class OneDriveService:
                 'grant_type': 'client_credentials'
             }
             
-            print("🔄 Refreshing SharePoint access token...")
+            logger.info("Refreshing SharePoint access token...")
             response = requests.post(token_url, data=data)
             
             if response.status_code == 200:
@@ -82,14 +90,14 @@ class OneDriveService:
                 expires_in = token_data.get('expires_in', 3600)
                 self.token_expires_at = time.time() + expires_in
                 
-                print("✅ SharePoint access token refreshed successfully")
+                logger.info("SharePoint access token refreshed successfully")
                 return True
             else:
-                print(f"❌ Token refresh failed: {response.status_code} - {response.text}")
+                logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Error refreshing token: {e}")
+            logger.error(f"Error refreshing token: {e}")
             return False
     
     def _make_authenticated_request(self, method: str, url: str, **kwargs) -> requests.Response:
@@ -108,13 +116,13 @@ class OneDriveService:
         
         # If we get 401, try refreshing token once
         if response.status_code == 401:
-            print("🔄 Received 401, attempting token refresh...")
+            logger.info("Received 401, attempting token refresh...")
             if self._get_new_access_token():
                 # Retry the request with new token
                 headers['Authorization'] = f'Bearer {self.access_token}'
                 response = requests.request(method, url, **kwargs)
             else:
-                print("❌ Token refresh failed, request will fail")
+                logger.error("Token refresh failed, request will fail")
         
         return response
         
@@ -133,17 +141,16 @@ class OneDriveService:
             # First try SharePoint upload
             sharepoint_result = self._sharepoint_upload(file_content, filename)
             if sharepoint_result.get("success"):
-                print(f"✅ File uploaded to SharePoint: {filename}")
+                logger.info(f"File uploaded to SharePoint: {filename}")
                 return sharepoint_result
             
             # If SharePoint fails, fallback to local storage
-            print(f"⚠️ SharePoint upload failed, falling back to local storage")
+            logger.warning("SharePoint upload failed, falling back to local storage")
             local_result = self._local_fallback_upload(file_content, filename)
             return local_result
 
         except Exception as e:
-            error_msg = f"Upload error: {str(e)}"
-            print(error_msg)
+            logger.error(f"Upload error: {e}")
             # Try local fallback even on exception
             try:
                 return self._local_fallback_upload(file_content, filename)
@@ -182,7 +189,7 @@ class OneDriveService:
                     if file_id:
                         download_url = f"{self.base_url}/sites/{self.sharepoint_site_id}/drive/items/{file_id}/content"
                 
-                print(f"✅ SharePoint upload successful: {filename}")
+                logger.info(f"SharePoint upload successful: {filename}")
                 return {
                     "success": True,
                     "file_url": file_data.get('webUrl'),
@@ -193,7 +200,7 @@ class OneDriveService:
                 }
             else:
                 error_msg = f"SharePoint upload failed: {response.status_code} - {response.text}"
-                print(f"❌ {error_msg}")
+                logger.error(error_msg)
                 return {
                     "success": False,
                     "error": error_msg
@@ -201,7 +208,7 @@ class OneDriveService:
                 
         except Exception as e:
             error_msg = f"SharePoint upload error: {str(e)}"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
     def _local_fallback_upload(self, file_content: bytes, filename: str) -> Dict[str, Any]:
@@ -209,12 +216,8 @@ class OneDriveService:
         Fallback to local storage when SharePoint fails
         """
         try:
-            # Ensure uploads directory exists
-            uploads_dir = "uploads"
-            os.makedirs(uploads_dir, exist_ok=True)
-            
-            # Save file locally
-            local_path = os.path.join(uploads_dir, filename)
+            # Save file locally (directory is created once in __init__)
+            local_path = os.path.join(self.uploads_dir, filename)
             with open(local_path, 'wb') as f:
                 f.write(file_content)
             
@@ -245,7 +248,7 @@ class OneDriveService:
 
             if response.status_code in [200, 201]:
                 file_data = response.json()
-                print(f"SUCCESS: File uploaded via simple PUT method")
+                logger.info("File uploaded via simple PUT method")
                 return {
                     "success": True,
                     "file_url": file_data.get('webUrl'),
@@ -254,11 +257,11 @@ class OneDriveService:
                     "download_url": file_data.get('@microsoft.graph.downloadUrl')
                 }
             else:
-                print(f"Simple PUT upload failed: {response.status_code} - {response.text}")
+                logger.error(f"Simple PUT upload failed: {response.status_code} - {response.text}")
                 return {"success": False, "error": f"Simple PUT failed: {response.text}"}
 
         except Exception as e:
-            print(f"Simple PUT upload error: {str(e)}")
+            logger.error(f"Simple PUT upload error: {str(e)}")
             return {"success": False, "error": str(e)}
 
     def _folder_upload(self, file_content: bytes, filename: str) -> Dict[str, Any]:
@@ -276,7 +279,7 @@ class OneDriveService:
 
             if response.status_code in [200, 201]:
                 file_data = response.json()
-                print(f"SUCCESS: File uploaded to folder")
+                logger.info("File uploaded to folder")
                 return {
                     "success": True,
                     "file_url": file_data.get('webUrl'),
@@ -285,11 +288,11 @@ class OneDriveService:
                     "download_url": file_data.get('@microsoft.graph.downloadUrl')
                 }
             else:
-                print(f"Folder upload failed: {response.status_code} - {response.text}")
+                logger.error(f"Folder upload failed: {response.status_code} - {response.text}")
                 return {"success": False, "error": f"Folder upload failed: {response.text}"}
 
         except Exception as e:
-            print(f"Folder upload error: {str(e)}")
+            logger.error(f"Folder upload error: {str(e)}")
             return {"success": False, "error": str(e)}
 
     def _special_folder_upload(self, file_content: bytes, filename: str) -> Dict[str, Any]:
@@ -307,7 +310,7 @@ class OneDriveService:
 
             if response.status_code in [200, 201]:
                 file_data = response.json()
-                print(f"SUCCESS: File uploaded to app folder")
+                logger.info("File uploaded to app folder")
                 return {
                     "success": True,
                     "file_url": file_data.get('webUrl'),
@@ -316,11 +319,11 @@ class OneDriveService:
                     "download_url": file_data.get('@microsoft.graph.downloadUrl')
                 }
             else:
-                print(f"Special folder upload failed: {response.status_code} - {response.text}")
+                logger.error(f"Special folder upload failed: {response.status_code} - {response.text}")
                 return {"success": False, "error": f"Special folder upload failed: {response.text}"}
 
         except Exception as e:
-            print(f"Special folder upload error: {str(e)}")
+            logger.error(f"Special folder upload error: {str(e)}")
             return {"success": False, "error": str(e)}
 
     def _session_upload(self, file_content: bytes, filename: str) -> Dict[str, Any]:
@@ -357,7 +360,7 @@ class OneDriveService:
 
                 if upload_response.status_code in [200, 201]:
                     file_data = upload_response.json()
-                    print(f"SUCCESS: File uploaded via session")
+                    logger.info("File uploaded via session")
                     return {
                         "success": True,
                         "file_url": file_data.get('webUrl'),
@@ -366,14 +369,14 @@ class OneDriveService:
                         "download_url": file_data.get('@microsoft.graph.downloadUrl')
                     }
                 else:
-                    print(f"Session content upload failed: {upload_response.status_code} - {upload_response.text}")
+                    logger.error(f"Session content upload failed: {upload_response.status_code} - {upload_response.text}")
                     return {"success": False, "error": f"Session upload failed: {upload_response.text}"}
             else:
-                print(f"Failed to create upload session: {response.status_code} - {response.text}")
+                logger.error(f"Failed to create upload session: {response.status_code} - {response.text}")
                 return {"success": False, "error": f"Session creation failed: {response.text}"}
 
         except Exception as e:
-            print(f"Session upload error: {str(e)}")
+            logger.error(f"Session upload error: {str(e)}")
             return {"success": False, "error": str(e)}
 
     def get_file_url(self, file_id: str) -> Optional[str]:
@@ -395,11 +398,11 @@ class OneDriveService:
                 file_data = response.json()
                 return file_data.get('webUrl')
             else:
-                print(f"Failed to get file URL: {response.status_code} - {response.text}")
+                logger.error(f"Failed to get file URL: {response.status_code} - {response.text}")
                 return None
 
         except Exception as e:
-            print(f"Error getting file URL: {str(e)}")
+            logger.error(f"Error getting file URL: {str(e)}")
             return None
 
     def get_fresh_download_url(self, file_id: str) -> Optional[str]:
@@ -423,17 +426,17 @@ class OneDriveService:
                 # Get the download URL for direct access
                 download_url = file_data.get('@microsoft.graph.downloadUrl')
                 if download_url:
-                    print(f"✅ Fresh download URL obtained for file: {file_id}")
+                    logger.info(f"Fresh download URL obtained for file: {file_id}")
                     return download_url
                 else:
-                    print(f"⚠️ No download URL in response for file: {file_id}")
+                    logger.warning(f"No download URL in response for file: {file_id}")
                     return None
             else:
-                print(f"❌ Failed to get fresh download URL: {response.status_code} - {response.text}")
+                logger.error(f"Failed to get fresh download URL: {response.status_code} - {response.text}")
                 return None
 
         except Exception as e:
-            print(f"❌ Error getting fresh download URL: {str(e)}")
+            logger.error(f"Error getting fresh download URL: {str(e)}")
             return None
 
     def delete_file(self, file_id: str) -> bool:
@@ -454,11 +457,11 @@ class OneDriveService:
             if response.status_code == 204:
                 return True
             else:
-                print(f"Failed to delete file: {response.status_code} - {response.text}")
+                logger.error(f"Failed to delete file: {response.status_code} - {response.text}")
                 return False
 
         except Exception as e:
-            print(f"Error deleting file: {str(e)}")
+            logger.error(f"Error deleting file: {str(e)}")
             return False
 
     def get_folder_id(self, folder_name: str) -> Optional[str]:
@@ -488,7 +491,7 @@ class OneDriveService:
             return None
 
         except Exception as e:
-            print(f"Error getting folder ID: {str(e)}")
+            logger.error(f"Error getting folder ID: {str(e)}")
             return None
 
     def create_folder(self, folder_name: str) -> Optional[str]:
@@ -523,11 +526,11 @@ class OneDriveService:
             if response.status_code == 201:
                 return response.json()['id']
             else:
-                print(f"Failed to create folder: {response.status_code} - {response.text}")
+                logger.error(f"Failed to create folder: {response.status_code} - {response.text}")
                 return None
 
         except Exception as e:
-            print(f"Error creating folder: {str(e)}")
+            logger.error(f"Error creating folder: {str(e)}")
             return None
 
 
@@ -29,9 +29,9 @@ class UnifiedToolDetector:
         if not self.gemini_detector.is_available():
             logger.warning("Google Cloud AI (Gemini) is not available. Please check your API key configuration.")
     
-    def detect_tools(
-        self, 
-        image_path: str, 
+    async def detect_tools(
+        self,
+        image_path: str,
         model_type: Optional[str] = None
     ) -> Tuple[List[str], List[float], Dict[str, Any]]:
         """
@@ -56,16 +56,43 @@ class UnifiedToolDetector:
         
         import time
         start_time = time.time()
-        
-        return self._detect_with_gemini(image_path, metadata)
-    
-    def _detect_with_gemini(self, image_path: str, metadata: Dict[str, Any]) -> Tuple[List[str], List[float], Dict[str, Any]]:
+
+        return await self._detect_with_gemini(self.gemini_detector.detect_tools, image_path, metadata)
+
+    async def detect_tools_from_bytes(
+        self,
+        image_bytes: bytes,
+        model_type: Optional[str] = None
+    ) -> Tuple[List[str], List[float], Dict[str, Any]]:
+        """
+        Detect tools in an in-memory image using Google Cloud AI (Gemini)
+
+        Args:
+            image_bytes: Raw image bytes (avoids a temp-file round-trip)
+            model_type: Ignored (kept for API compatibility)
+
+        Returns:
+            Tuple of (tags, confidences, metadata)
+        """
+        metadata = {
+            "model_used": "gemini",
+            "models_tried": ["gemini"],
+            "detection_time": 0,
+            "confidence_scores": {},
+            "model_availability": {
+                "gemini": self.gemini_detector.is_available()
+            }
+        }
+
+        return await self._detect_with_gemini(self.gemini_detector.detect_tools_from_bytes, image_bytes, metadata)
+
+    async def _detect_with_gemini(self, detect_fn, image, metadata: Dict[str, Any]) -> Tuple[List[str], List[float], Dict[str, Any]]:
         """Detect tools using Google Cloud AI (Gemini)"""
         logger.info("Using Google Cloud AI (Gemini) for tool detection")
         metadata["models_tried"].append("gemini")
-        
+
         try:
-            tags, confidences = self.gemini_detector.detect_tools(image_path)
+            tags, confidences = await detect_fn(image)
             metadata["model_used"] = "gemini"
             metadata["confidence_scores"]["gemini"] = {
                 "avg_confidence": sum(confidences) / len(confidences) if confidences else 0,
@@ -45,7 +45,19 @@ def init_database():
             result = conn.execute(text("SELECT PostGIS_version();"))
             version = result.scalar()
             print(f"📍 PostGIS version: {version}")
-            
+
+            # Create the immutable array_to_string wrapper used by the
+            # tags_text generated column - must exist before create_all
+            # emits the images DDL
+            print("🔧 Creating immutable_array_to_string helper...")
+            conn.execute(text(
+                "CREATE OR REPLACE FUNCTION immutable_array_to_string(text[], text) "
+                "RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS "
+                "$$ SELECT array_to_string($1, $2) $$"
+            ))
+            conn.commit()
+            print("✅ Helper function created")
+
             # Create tables
             print("📊 Creating database tables...")
             from app.database.models import Base
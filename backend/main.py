@@ -3,28 +3,83 @@ Tool Detection & Geotag Search Application
 FastAPI Backend Entry Point
 """
 
+import logging
+import logging.handlers
 import os
+import queue
 from contextlib import asynccontextmanager
+
+import httpx
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 
+# Load environment variables before the app modules are imported - they
+# read configuration (and now build singletons) at import time
+load_dotenv()
+
 from app.api.routes import router
 # from app.api.chat_routes import router as chat_router
-from app.database.connection import init_db
+from app.database.connection import init_db, warm_connection_pool, SessionLocal
+from app.database.queries import refresh_file_exists
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # No local storage needed - using OneDrive only
 
 
+def _setup_logging() -> logging.handlers.QueueListener:
+    """
+    Configure root logging through a queue.
+
+    Handlers write to stderr from a background thread, so log calls inside
+    async request handlers only enqueue a record and never block the event
+    loop on stdio.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s - %(message)s")
+    )
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+
+    listener.start()
+    return listener
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database and models on startup"""
-    init_db()
+    """Initialize logging, database and models on startup"""
+    log_listener = _setup_logging()
+    await init_db()
+    # Open the pooled DB connections now so the first requests don't pay
+    # the connection handshake
+    await warm_connection_pool()
+    # Reconcile file_exists flags with one directory scan instead of
+    # per-row existence checks at query time
+    upload_dir = os.getenv("UPLOAD_DIR", "uploads")
+    try:
+        with os.scandir(upload_dir) as entries:
+            present = {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        present = set()
+    async with SessionLocal() as db:
+        changed = await refresh_file_exists(db, present)
+    if changed:
+        logger.info(f"file_exists reconciled for {changed} images")
+    # One shared async HTTP client for outbound calls (SharePoint proxying)
+    # so connections are pooled and requests never block the event loop
+    app.state.http_client = httpx.AsyncClient(timeout=30.0)
     yield
-    # Cleanup on shutdown if needed
+    await app.state.http_client.aclose()
+    # Flush any queued log records on shutdown
+    log_listener.stop()
 
 
 # Create FastAPI app
@@ -32,7 +87,10 @@ app = FastAPI(
     title="Tool Detection API",
     description="API for detecting and geotagging work tools from images",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson renders the large search/inventory payloads several times
+    # faster than the stdlib encoder
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -47,6 +105,11 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Compress larger JSON payloads (search results, inventory). Small bodies
+# aren't worth the CPU, and starlette leaves text/event-stream responses
+# alone so the chat SSE stream keeps its per-chunk latency.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include API routes
 app.include_router(router, prefix="/api")
 # app.include_router(chat_router, prefix="/api")
@@ -73,9 +136,16 @@ async def health_check():
 if __name__ == "__main__":
     import uvicorn
 
+    # Use uvloop where available (not supported on Windows) - libuv's event
+    # loop has much cheaper scheduling primitives than the stdlib asyncio loop
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     host = os.getenv("API_HOST", "0.0.0.0")
     port = int(os.getenv("API_PORT", "8000"))
-    print(os.getenv("API_HOST"))
 
     uvicorn.run(
         "main:app",